@@ -1,6 +1,24 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat as stat_module
 from http import HTTPStatus
+from urllib.parse import quote
 
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (Http404, HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views.decorators.http import require_safe
+from posts.storage import HASHED_NAME_RE
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
 
 
 def page_not_found(request, exception):
@@ -34,3 +52,115 @@ def permission_denied(request, exception):
         'core/403.html',
         status=HTTPStatus.FORBIDDEN,
     )
+
+
+def _media_path(path):
+    """Путь к обычному файлу в разрешённых каталогах MEDIA_ROOT или 404.
+
+    Скрытые файлы и выход из каталогов через .. не отдаются.
+    """
+    path = posixpath.normpath(path)
+    if (
+        not path.startswith(settings.MEDIA_SERVE_PREFIXES)
+        or any(part.startswith('.') for part in path.split('/'))
+    ):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, SuspiciousFileOperation, ValueError):
+        raise Http404
+    if not stat_module.S_ISREG(stat.st_mode):
+        raise Http404
+    return path, full_path, stat
+
+
+def _read_range(full_path, start, length, block_size=64 * 1024):
+    with open(full_path, 'rb') as media:
+        media.seek(start)
+        while length > 0:
+            block = media.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _byte_range(header, size):
+    """(start, end) из заголовка Range; None — отдать весь файл,
+    False — диапазон за пределами файла."""
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """Отдаёт файл из MEDIA_ROOT.
+
+    После проверок передачу берёт фронт-сервер (X-Accel-Redirect у nginx,
+    X-Sendfile у Apache и lighttpd), если это включено в MEDIA_ACCEL.
+    Путь в заголовке %-кодируется: нелатинские старые имена Django
+    записал бы по RFC 2047, а фронт-серверы понимают только %XX.
+    Без фронт-сервера файл отдаётся здесь же с поддержкой Range и
+    If-None-Match.
+    Хешированные имена не переиспользуются, и их содержимое кешируется
+    навсегда; старые имена могут смениться и всегда перепроверяются.
+    """
+    path, full_path, stat = _media_path(path)
+    content_type, encoding = mimetypes.guess_type(full_path)
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    elif settings.MEDIA_ACCEL == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_ACCEL_PREFIX + path
+        )
+    elif settings.MEDIA_ACCEL == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = quote(full_path)
+    else:
+        response = _file_response(request, full_path, stat, content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if not HASHED_NAME_RE.search(path):
+        response['Cache-Control'] = REVALIDATE_CACHE
+    elif response.status_code in (HTTPStatus.OK, HTTPStatus.PARTIAL_CONTENT):
+        response['Cache-Control'] = IMMUTABLE_CACHE
+    return response
+
+
+def _file_response(request, full_path, stat, content_type):
+    size = stat.st_size
+    byte_range = _byte_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        response = HttpResponse(
+            status=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(
+        _read_range(full_path, start, length),
+        content_type=content_type or 'application/octet-stream',
+    )
+    if byte_range:
+        response.status_code = HTTPStatus.PARTIAL_CONTENT
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    return response
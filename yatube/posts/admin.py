@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Comment, Group, Post
+from .search import matches
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -22,6 +23,13 @@ class PostAdmin(admin.ModelAdmin):
     )
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            pk__in=matches(search_term).values('post_id')
+        ), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,193 @@
+import hashlib
+import time
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+FEED_VERSION_KEY = 'posts:feed_version'
+OBJECT_KEY = 'posts:object:{}:{}:{}:{}'
+MISSING = 'missing'
+
+
+def fresh_version():
+    # Версия от времени: после вытеснения ключа она не начнётся заново
+    # и не совпадёт со старыми записями в кеше.
+    return int(time.time() * 1000)
+
+
+def now_and_on_commit(func):
+    """Вызывает func сразу и ещё раз после фиксации транзакции.
+
+    Повторный вызов убирает то, что параллельный запрос прочитал из базы
+    до фиксации и успел положить в кеш уже под новой версией.
+    """
+    func()
+    transaction.on_commit(func)
+
+
+def feed_version():
+    version = cache.get(FEED_VERSION_KEY)
+    if version is None:
+        version = fresh_version()
+        if not cache.add(FEED_VERSION_KEY, version, None):
+            version = cache.get(FEED_VERSION_KEY, version)
+    return version
+
+
+def bump_feed_version():
+    try:
+        cache.incr(FEED_VERSION_KEY)
+    except ValueError:
+        cache.set(FEED_VERSION_KEY, fresh_version(), None)
+
+
+def feed_cache(page_obj, feed, *scope):
+    """Параметры {% cache %} для фрагмента ленты.
+
+    Ключ включает вид ленты, её владельца (группу, автора, читателя),
+    страницу или курсор, посты с недорезанными миниатюрами и версию
+    содержимого, поэтому разные страницы не смешиваются, а любое
+    изменение постов сразу даёт новый ключ.
+    """
+    page = page_obj.number or page_obj.cursor
+    # Посты, чьи миниатюры ещё режутся: фрагмент с заглушками не должен
+    # пережить их готовность.
+    pending = [
+        post.pk for post in page_obj
+        if not getattr(post, 'thumbnails_ready', True)
+    ]
+    return {
+        'timeout': settings.FEED_CACHE_TIMEOUT,
+        'key': ':'.join(
+            str(part) for part in (feed, *scope, page, *pending)
+        ),
+        'version': feed_version(),
+    }
+
+
+def cached_lookups():
+    """Модели объектного кеша и поля, по которым их ищут."""
+    # Модели достаются из реестра: cache импортируется из querycache,
+    # который нужен models.
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    User = get_user_model()
+    return {
+        Post: ('pk',),
+        Group: ('pk', 'slug'),
+        User: ('pk', User.USERNAME_FIELD),
+    }
+
+
+@lru_cache(maxsize=None)
+def schema_version(model):
+    # Набор полей входит в ключ: после миграции объекты старой формы не
+    # достаются из кеша, а просто вытесняются по таймауту.
+    fields = ','.join(field.attname for field in model._meta.concrete_fields)
+    return hashlib.md5(fields.encode()).hexdigest()[:8]
+
+
+def object_key(model, field, value):
+    return OBJECT_KEY.format(
+        model._meta.label_lower, schema_version(model), field,
+        quote(str(value)),
+    )
+
+
+def object_keys(instance):
+    """Ключи, под которыми объект лежит в кеше, по загруженным полям."""
+    model = type(instance)
+    keys = []
+    for field in cached_lookups().get(model, ()):
+        attname = model._meta.pk.attname if field == 'pk' else field
+        if instance.__dict__.get(attname) is not None:
+            keys.append(object_key(model, field, instance.__dict__[attname]))
+    return keys
+
+
+def get_objects(model, values, field='pk'):
+    """Объекты по значениям поля: один запрос к кешу и не больше одного к
+    базе на недостающие. Ненайденных значений в ответе нет."""
+    return fetch_objects([(model, field, values)])[model, field]
+
+
+def fetch_objects(lookups):
+    """Пакетное чтение объектов разных моделей за один запрос к кешу.
+
+    lookups — тройки (модель, поле, значения); ответ — словари
+    значение → объект под ключами (модель, поле).
+    """
+    wanted = {
+        object_key(model, field, value): (model, field, value)
+        for model, field, values in lookups
+        for value in set(values)
+        if value is not None
+    }
+    cached = cache.get_many(wanted)
+    found = {(model, field): {} for model, field, _ in lookups}
+    missing = {}
+    for key, (model, field, value) in wanted.items():
+        if key not in cached:
+            missing.setdefault((model, field), []).append(value)
+        elif cached[key] != MISSING:
+            found[model, field][value] = cached[key]
+    for (model, field), values in missing.items():
+        objects = model._default_manager.filter(**{f'{field}__in': values})
+        # Отсутствие тоже кешируется: ключ сбросит сохранение нового
+        # объекта с тем же значением.
+        fill = {object_key(model, field, value): MISSING for value in values}
+        for obj in objects:
+            found[model, field][getattr(obj, field)] = obj
+            fill.update((key, obj) for key in object_keys(obj))
+        cache.set_many(
+            fill, settings.OBJECT_CACHE_TIMEOUTS[model._meta.label]
+        )
+    return found
+
+
+def get_cached_or_404(model, **lookup):
+    """Кешируемая замена get_object_or_404 для поиска по одному полю
+    из cached_lookups."""
+    (field, value), = lookup.items()
+    obj = get_objects(model, [value], field).get(value)
+    if obj is None:
+        raise Http404(f'{model._meta.object_name} не найден')
+    return obj
+
+
+def attach_related(objects, *fields):
+    """Подставляет объектам связанные объекты из кеша одним пакетом."""
+    if not objects:
+        return objects
+    lookups = []
+    for name in fields:
+        related = objects[0]._meta.get_field(name).related_model
+        lookups.append((related, 'pk', [
+            getattr(obj, f'{name}_id') for obj in objects
+        ]))
+    found = fetch_objects(lookups)
+    for name, (related, _, _) in zip(fields, lookups):
+        for obj in objects:
+            value = found[related, 'pk'].get(getattr(obj, f'{name}_id'))
+            if value is not None:
+                setattr(obj, name, value)
+    return objects
+
+
+def forget_objects(keys):
+    """Сбрасывает объекты сразу и ещё раз после фиксации транзакции."""
+    keys = list(keys)
+    if keys:
+        now_and_on_commit(lambda: cache.delete_many(keys))
+
+
+def forget_posts(pks):
+    """Сбрасывает посты, изменённые в обход сигналов (update, bulk_update)."""
+    Post = apps.get_model('posts', 'Post')
+    forget_objects(object_key(Post, 'pk', pk) for pk in pks)
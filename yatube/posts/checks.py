@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии и блокировки в кеше работают, только если он общий."""
+    if cache_is_shared():
+        return []
+    return [
+        Warning(
+            'Кеш по умолчанию не общий для процессов: подписки, ленты и '
+            'блокировки миниатюр в разных воркерах разойдутся.',
+            hint='Задайте адрес memcached в переменной YATUBE_MEMCACHED.',
+            id='posts.W001',
+        )
+    ]
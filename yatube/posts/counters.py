@@ -0,0 +1,103 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, F, Q
+
+from .models import Comment, Counter, Follow, Post
+
+# Что и по какому полю считаем: вид счётчика -> (модель, внешний ключ).
+COUNTED = {
+    Counter.AUTHOR_POSTS: (Post, 'author_id'),
+    Counter.GROUP_POSTS: (Post, 'group_id'),
+    Counter.POST_COMMENTS: (Comment, 'post_id'),
+    Counter.FOLLOWERS: (Follow, 'author_id'),
+    Counter.FOLLOWING: (Follow, 'user_id'),
+}
+
+
+def counted_fields(model):
+    """Пары (внешний ключ, вид счётчика), которые зависят от строк model."""
+    return [
+        (attr, kind)
+        for kind, (counted_model, attr) in COUNTED.items()
+        if counted_model is model
+    ]
+
+
+def shift(kind, object_id, delta):
+    """Атомарно сдвигает счётчик; отсутствующая строка посчитается при
+    первом чтении, поэтому её не создаём."""
+    if object_id is None or not delta:
+        return
+    counters = Counter.objects.filter(kind=kind, object_id=object_id)
+    if delta < 0:
+        counters = counters.filter(value__gte=-delta)
+    counters.update(value=F('value') + delta)
+
+
+def recount(kind, object_ids):
+    """Точные значения счётчика для набора объектов одним запросом."""
+    model, attr = COUNTED[kind]
+    values = dict.fromkeys(object_ids, 0)
+    rows = (
+        model.objects.filter(**{f'{attr}__in': object_ids})
+        .order_by()
+        .values_list(attr)
+        .annotate(total=Count('pk'))
+    )
+    values.update(rows)
+    return values
+
+
+def get_counts(*keys):
+    """Значения счётчиков по ключам (вид, id объекта).
+
+    Читает все ключи одним запросом; недостающие строки считаются по
+    таблице один раз и дальше поддерживаются сигналами.
+    """
+    if not keys:
+        return {}
+    condition = reduce(
+        or_,
+        (Q(kind=kind, object_id=object_id) for kind, object_id in keys),
+    )
+    counts = {
+        (kind, object_id): value
+        for kind, object_id, value in Counter.objects.filter(
+            condition
+        ).values_list('kind', 'object_id', 'value')
+    }
+    missing = [key for key in keys if key not in counts]
+    for kind in {kind for kind, _ in missing}:
+        values = recount(
+            kind, [object_id for key_kind, object_id in missing
+                   if key_kind == kind]
+        )
+        Counter.objects.bulk_create(
+            [
+                Counter(kind=kind, object_id=object_id, value=value)
+                for object_id, value in values.items()
+            ],
+            ignore_conflicts=True,
+        )
+        counts.update(
+            ((kind, object_id), value) for object_id, value in values.items()
+        )
+    return counts
+
+
+def get_count(kind, object_id):
+    return get_counts((kind, object_id))[(kind, object_id)]
+
+
+def author_counts(author):
+    counts = get_counts(
+        (Counter.AUTHOR_POSTS, author.pk),
+        (Counter.FOLLOWERS, author.pk),
+        (Counter.FOLLOWING, author.pk),
+    )
+    return {
+        'posts': counts[(Counter.AUTHOR_POSTS, author.pk)],
+        'followers': counts[(Counter.FOLLOWERS, author.pk)],
+        'following': counts[(Counter.FOLLOWING, author.pk)],
+    }
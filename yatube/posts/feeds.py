@@ -0,0 +1,22 @@
+from .models import Post
+
+# Ровно те колонки, что читает карточка posts/includes/post_list.html.
+CARD_FIELDS = (
+    'text',
+    'pub_date',
+    'updated',
+    'image',
+    'image_width',
+    'image_height',
+    'author',
+    'author__username',
+    'group',
+    'group__slug',
+    'group__title',
+)
+
+
+def feed_posts():
+    """Базовый запрос любой ленты: автор и группа в одном JOIN, без лишних
+    колонок, поэтому страница ленты стоит фиксированное число запросов."""
+    return Post.objects.select_related('author', 'group').only(*CARD_FIELDS)
@@ -0,0 +1,106 @@
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .cache import now_and_on_commit
+from .models import Follow
+
+GRAPH_VERSION_KEY = 'posts:follow_graph:{}'
+
+_graph = OrderedDict()
+_graph_lock = threading.Lock()
+
+
+def follow(user, author):
+    """Подписывает user на author одним INSERT; повтор отсекает
+    ограничение unique_follow. Возвращает True, если подписка создана."""
+    if user == author:
+        return False
+    try:
+        with transaction.atomic():
+            Follow.objects.create(user=user, author=author)
+    except IntegrityError:
+        return False
+    return True
+
+
+def unfollow(user, author):
+    """Отписывает user от author. Возвращает True, если подписка была.
+
+    Это не один DELETE: у Follow есть получатели post_delete (счётчики,
+    лента, версия графа подписок), поэтому Collector сначала выбирает
+    строку, затем удаляет её по id и вызывает получателей.
+    """
+    deleted, _ = Follow.objects.filter(user=user, author=author).delete()
+    return bool(deleted)
+
+
+def invalidate_graph(user_id):
+    """Новая версия списка подписок: копии во всех процессах и фрагменты
+    ленты подписок устаревают."""
+    key = GRAPH_VERSION_KEY.format(user_id)
+    now_and_on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
+
+
+def graph_version(user_id):
+    key = GRAPH_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def followed_ids(user_id):
+    """Отсортированный массив id авторов, на которых подписан user_id.
+
+    Массив живёт в памяти процесса и сверяется с версией в общем кэше,
+    так что тёплая проверка не обращается к базе.
+    """
+    version = graph_version(user_id)
+    with _graph_lock:
+        cached = _graph.get(user_id)
+        if cached is not None and cached[0] == version:
+            _graph.move_to_end(user_id)
+            return cached[1]
+    ids = array('L', sorted(
+        Follow.objects.filter(user_id=user_id).values_list(
+            'author_id', flat=True
+        )
+    ))
+    with _graph_lock:
+        _graph[user_id] = (version, ids)
+        _graph.move_to_end(user_id)
+        while len(_graph) > settings.FOLLOW_GRAPH_CACHE_SIZE:
+            _graph.popitem(last=False)
+    return ids
+
+
+def is_following(user_id, author_id):
+    ids = followed_ids(user_id)
+    position = bisect_left(ids, author_id)
+    return position < len(ids) and ids[position] == author_id
+
+
+def common_follows(user_id, other_id):
+    """Авторы, на которых подписаны оба: слияние двух отсортированных
+    массивов за линейное время."""
+    first, second = followed_ids(user_id), followed_ids(other_id)
+    common = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        if first[i] == second[j]:
+            common.append(first[i])
+            i += 1
+            j += 1
+        elif first[i] < second[j]:
+            i += 1
+        else:
+            j += 1
+    return common
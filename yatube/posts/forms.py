@@ -1,6 +1,9 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.translation import gettext_lazy as _
+from PIL import Image
 
+from .images import ingest
 from .models import Post, Comment
 
 
@@ -21,6 +24,17 @@ class PostForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['text'].widget.attrs.update({'class': 'form-control'})
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return ingest(image)
+        except (OSError, Image.DecompressionBombError):
+            raise forms.ValidationError(
+                _('Не удалось обработать картинку.')
+            )
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
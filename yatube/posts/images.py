@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, ImageOps, ImageSequence, features
+
+WEBP_SUPPORTED = features.check('webp')
+PNG_MODES = ('1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA')
+
+
+def ingest(upload):
+    """Готовит загруженную картинку к хранению.
+
+    Число пикселей (всех кадров анимации) проверяется по заголовку, до
+    декодирования: больше POST_IMAGE_MAX_PIXELS — DecompressionBombError.
+    JPEG декодируется сразу в уменьшенном масштабе (draft); остальные
+    форматы так не умеют, и их полный кадр ограничен этим порогом.
+    Поворот из EXIF применяется уже к уменьшенным пикселям, сами
+    метаданные удаляются, JPEG сохраняется прогрессивным. Анимация
+    ужимается покадрово. Форматы, которые Pillow только читает (XPM, PSD
+    и подобные), перекодируются в PNG. Результат пишется во временный
+    файл, который уходит на диск, если не помещается в память.
+    """
+    limit = settings.POST_IMAGE_MAX_SIZE
+    upload.seek(0)
+    with Image.open(upload) as source:
+        frames = getattr(source, 'n_frames', 1)
+        if source.width * source.height * frames > (
+            settings.POST_IMAGE_MAX_PIXELS
+        ):
+            raise Image.DecompressionBombError(
+                f'{source.width}x{source.height}x{frames} пикселей'
+            )
+        image_format = source.format
+        name = upload.name
+        if image_format not in Image.SAVE:
+            image_format = 'PNG'
+            name = os.path.splitext(name)[0] + '.png'
+        params = {'format': image_format, 'optimize': True}
+        if getattr(source, 'is_animated', False):
+            image, *more = _shrink_frames(source, limit, image_format)
+            params.update(
+                save_all=True,
+                append_images=more,
+                duration=[frame.info.get('duration', 100) for frame in (
+                    image, *more
+                )],
+                loop=source.info.get('loop', 0),
+            )
+        else:
+            source.draft(source.mode, (limit, limit))
+            source.thumbnail((limit, limit), reducing_gap=3.0)
+            image = _savable(ImageOps.exif_transpose(source), image_format)
+        image.info.pop('exif', None)
+        if image_format == 'JPEG':
+            params.update(
+                quality=settings.POST_IMAGE_QUALITY, progressive=True
+            )
+        elif image_format == 'WEBP':
+            params.update(quality=settings.POST_IMAGE_QUALITY)
+        output = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        image.save(output, **params)
+    output.seek(0)
+    return File(output, name=name)
+
+
+def _shrink_frames(source, limit, image_format):
+    """Кадры анимации, уменьшенные до limit и без EXIF."""
+    frames = []
+    for frame in ImageSequence.Iterator(source):
+        frame = frame.copy()
+        frame.thumbnail((limit, limit), reducing_gap=3.0)
+        frame.info.pop('exif', None)
+        frames.append(_savable(frame, image_format))
+    return frames
+
+
+def _savable(image, image_format):
+    """Картинка в режиме, который примет PNG при перекодировании."""
+    if image_format != 'PNG' or image.mode in PNG_MODES:
+        return image
+    has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def served_formats():
+    """Форматы миниатюр от самого компактного; None — формат sorl."""
+    return ('WEBP', None) if WEBP_SUPPORTED else (None,)
@@ -0,0 +1,65 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.images import get_image_dimensions
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.cache import bump_feed_version, forget_posts
+from posts.models import Post
+from posts.querycache import invalidate_tables
+
+
+class Command(BaseCommand):
+    help = 'Записывает размеры картинок постов, загруженных до их учёта.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Сколько постов обрабатывать за один проход.',
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        storage = Post._meta.get_field('image').storage
+        pending = Post.objects.exclude(image='').filter(image_width=None)
+        last_pk = 0
+        filled = missing = 0
+        while True:
+            chunk = list(
+                pending.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'image')[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            sized = []
+            now = timezone.now()
+            for pk, name in chunk:
+                try:
+                    with storage.open(name) as image:
+                        width, height = get_image_dimensions(image)
+                except (OSError, SuspiciousFileOperation):
+                    width = height = None
+                if width is None:
+                    missing += 1
+                    continue
+                sized.append(Post(
+                    pk=pk, image_width=width, image_height=height,
+                    updated=now,
+                ))
+            Post.objects.bulk_update(
+                sized, ['image_width', 'image_height', 'updated']
+            )
+            if sized:
+                # bulk_update не шлёт сигналов; новый updated меняет ключ
+                # карточки, остальные кеши сбрасываются явно.
+                forget_posts(post.pk for post in sized)
+                invalidate_tables(Post._meta.db_table)
+                bump_feed_version()
+            filled += len(sized)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Размеры записаны: {filled}, не удалось прочитать: {missing}'
+            )
+        )
@@ -0,0 +1,136 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import MediaFile, Post
+from posts.thumbnails import post_thumbnail_options
+
+
+def scan(root, prefix):
+    """Файлы каталога рекурсивно, без загрузки списка в память целиком."""
+    try:
+        entries = os.scandir(os.path.join(root, prefix))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            name = f'{prefix}/{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan(root, name)
+            elif entry.is_file(follow_symlinks=False):
+                yield name, entry.stat(follow_symlinks=False)
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов и миниатюры, на которые больше ничто не '
+        'ссылается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, сколько места освободится.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько постов читать из базы за один запрос.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Сколько файлов удалять между паузами.',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.5,
+            help='Пауза между пачками удалений, секунд.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60 * 60,
+            help=(
+                'Не трогать файлы моложе стольких секунд: их пост может '
+                'быть ещё не сохранён.'
+            ),
+        )
+
+    def handle(self, *args, dry_run, chunk_size, batch_size, pause,
+               min_age, **options):
+        referenced = self.referenced_names(chunk_size)
+        image_storage = Post.image.field.storage
+        sources = (
+            (Post.image.field.upload_to.strip('/'), image_storage),
+            (sorl_settings.THUMBNAIL_PREFIX.strip('/'), default.storage),
+        )
+        cutoff = time.time() - min_age
+        batch = []
+        found = reclaimable = 0
+        for prefix, storage in sources:
+            for name, stat in scan(settings.MEDIA_ROOT, prefix):
+                if name in referenced or stat.st_mtime > cutoff:
+                    continue
+                found += 1
+                reclaimable += stat.st_size
+                if dry_run:
+                    continue
+                batch.append((name, storage))
+                if len(batch) >= batch_size:
+                    self.delete(batch)
+                    batch = []
+                    time.sleep(pause)
+        if batch:
+            self.delete(batch)
+        verb = 'Можно удалить' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {found}, байт: {reclaimable}'
+        ))
+
+    def referenced_names(self, chunk_size):
+        """Картинки постов и все их текущие миниатюры, по частям из базы."""
+        backend = default.backend
+        referenced = set()
+        last_pk = 0
+        while True:
+            chunk = list(
+                Post.objects.exclude(image='').filter(pk__gt=last_pk)
+                .order_by('pk').only('image', 'image_width')[:chunk_size]
+            )
+            if not chunk:
+                return referenced
+            last_pk = chunk[-1].pk
+            for post in chunk:
+                referenced.add(post.image.name)
+                referenced.update(
+                    backend.thumbnail_file(
+                        post.image, geometry_string, dict(options)
+                    ).name
+                    for geometry_string, options in post_thumbnail_options(
+                        post.image_width
+                    )
+                )
+
+    def delete(self, batch):
+        """Удаляет файлы и забывает их в хранилище миниатюр и счётчиках."""
+        for name, storage in batch:
+            default.kvstore.delete(
+                ImageFile(name, storage), delete_thumbnails=False
+            )
+            try:
+                os.remove(storage.path(name))
+            except FileNotFoundError:
+                pass
+        MediaFile.objects.filter(
+            name__in=[name for name, _ in batch]
+        ).delete()
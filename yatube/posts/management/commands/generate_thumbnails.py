@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts.models import Post
+from posts.thumbnails import (acquire_lock, post_thumbnail_options,
+                              release_lock)
+
+
+class Command(BaseCommand):
+    help = (
+        'Нарезает недостающие миниатюры всех вариантов для картинок '
+        'постов. Готовые пропускаются, поэтому команду можно прерывать '
+        'и запускать снова.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Сколько постов обрабатывать за один проход.',
+        )
+        parser.add_argument(
+            '--start-pk',
+            type=int,
+            default=0,
+            help='Продолжить с постов, чей id больше этого.',
+        )
+
+    def handle(self, *args, chunk_size, start_pk, **options):
+        posts = Post.objects.exclude(image='').only('image', 'image_width')
+        last_pk = start_pk
+        generated = failed = 0
+        while True:
+            chunk = list(posts.filter(pk__gt=last_pk).order_by('pk')[
+                :chunk_size
+            ])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            for post in chunk:
+                try:
+                    generated += self.generate_missing(post)
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'Пост {post.pk}: {error}')
+            self.stdout.write(f'Обработаны посты до id {last_pk}')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Нарезано миниатюр: {generated}, ошибок: {failed}'
+            )
+        )
+
+    def generate_missing(self, post):
+        """Нарезает недостающие варианты, которые никто не режет сейчас."""
+        backend = default.backend
+        generated = 0
+        for geometry_string, options in post_thumbnail_options(
+            post.image_width
+        ):
+            thumbnail = backend.thumbnail_file(
+                post.image, geometry_string, dict(options)
+            )
+            if default.kvstore.get(thumbnail) or not acquire_lock(thumbnail):
+                continue
+            try:
+                backend.generate(post.image, geometry_string, **options)
+            finally:
+                release_lock(thumbnail)
+            generated += 1
+        return generated
@@ -0,0 +1,76 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.cache import bump_feed_version, forget_posts
+from posts.models import Post
+from posts.querycache import invalidate_tables
+from posts.storage import acquire
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов из плоского каталога posts/ в '
+        'хранилище с именами по содержимому. Перенесённые посты '
+        'пропускаются, поэтому команду можно прерывать и запускать снова.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Сколько постов переносить за один проход.',
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        last_pk = 0
+        moved = missing = 0
+        while True:
+            chunk = list(
+                Post.objects.exclude(image='').filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'image')[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            chunk_moved, chunk_missing = self.move(chunk)
+            moved += chunk_moved
+            missing += chunk_missing
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Перенесено картинок: {moved}, не найдено: {missing}'
+            )
+        )
+
+    def move(self, chunk):
+        storage = Post.image.field.storage
+        by_name = {}
+        for pk, name in chunk:
+            if not storage.is_hashed(name):
+                by_name.setdefault(name, []).append(pk)
+        now = timezone.now()
+        renamed = []
+        missing = 0
+        for name, pks in by_name.items():
+            try:
+                with storage.open(name) as image:
+                    new_name = storage.save(name, image)
+            except (OSError, SuspiciousFileOperation):
+                missing += len(pks)
+                continue
+            acquire(new_name, len(pks))
+            renamed.extend(
+                Post(pk=pk, image=new_name, updated=now) for pk in pks
+            )
+        Post.objects.bulk_update(renamed, ['image', 'updated'])
+        if renamed:
+            # bulk_update не шлёт сигналов: кеши со старым именем файла
+            # сбрасываются до его удаления.
+            forget_posts(post.pk for post in renamed)
+            invalidate_tables(Post._meta.db_table)
+            bump_feed_version()
+        for name in by_name:
+            storage.delete(name)
+        return len(renamed), missing
@@ -0,0 +1,15 @@
+from posts.management.stats import StatsCommand
+from posts.querycache import HIT, MISS, queryset_stats
+
+
+class Command(StatsCommand):
+    help = 'Показывает попадания в кеш результатов запросов.'
+
+    def report(self, reset):
+        for name, stats in queryset_stats(reset=reset).items():
+            total = stats[HIT] + stats[MISS]
+            hit_rate = stats[HIT] / total if total else 0
+            yield (
+                f'{name}: hit: {stats[HIT]}, miss: {stats[MISS]}, '
+                f'hit rate: {hit_rate:.1%}'
+            )
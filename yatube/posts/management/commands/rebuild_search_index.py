@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.search import index_post
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Сколько постов индексировать за один проход.',
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        last_pk = 0
+        indexed = 0
+        while True:
+            chunk = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', 'text', 'pub_date')[:chunk_size]
+            )
+            if not chunk:
+                break
+            for post in chunk:
+                index_post(post)
+            last_pk = chunk[-1].pk
+            indexed += len(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(f'Проиндексировано постов: {indexed}')
+        )
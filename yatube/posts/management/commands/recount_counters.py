@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount
+from posts.models import Counter
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сохранённые счётчики с таблицами и чинит расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько счётчиков сверять за один проход.',
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        last_pk = 0
+        checked = fixed = 0
+        while True:
+            chunk = list(
+                Counter.objects.filter(pk__gt=last_pk).order_by('pk')[
+                    :chunk_size
+                ]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            drifted = []
+            for kind in {counter.kind for counter in chunk}:
+                of_kind = [
+                    counter for counter in chunk if counter.kind == kind
+                ]
+                actual = recount(
+                    kind, [counter.object_id for counter in of_kind]
+                )
+                for counter in of_kind:
+                    if counter.value != actual[counter.object_id]:
+                        counter.value = actual[counter.object_id]
+                        drifted.append(counter)
+            Counter.objects.bulk_update(drifted, ['value'])
+            checked += len(chunk)
+            fixed += len(drifted)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Проверено счётчиков: {checked}, исправлено: {fixed}'
+            )
+        )
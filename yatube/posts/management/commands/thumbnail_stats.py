@@ -0,0 +1,15 @@
+from posts.management.stats import StatsCommand
+from posts.thumbnails import HIT, MISS, WAIT, thumbnail_stats
+
+
+class Command(StatsCommand):
+    help = 'Показывает, как часто миниатюры находятся готовыми.'
+
+    def report(self, reset):
+        stats = thumbnail_stats(reset=reset)
+        total = sum(stats.values())
+        hit_rate = stats[HIT] / total if total else 0
+        yield (
+            f'hit: {stats[HIT]}, miss: {stats[MISS]}, wait: {stats[WAIT]}, '
+            f'hit rate: {hit_rate:.1%}'
+        )
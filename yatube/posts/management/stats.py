@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.checks import cache_is_shared
+
+
+class StatsCommand(BaseCommand):
+    """Вывод счётчиков из общего кеша с необязательным обнулением."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода.',
+        )
+
+    def handle(self, *args, reset, **options):
+        if not cache_is_shared():
+            self.stderr.write(
+                'Кеш не общий: счётчики веб-процессов здесь не видны, '
+                'задайте YATUBE_MEMCACHED.'
+            )
+        for line in self.report(reset):
+            self.stdout.write(line)
+
+    def report(self, reset):
+        raise NotImplementedError
@@ -0,0 +1,40 @@
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+
+STATS_KEY = 'stats:{}'
+
+_counts = Counter()
+_lock = threading.Lock()
+
+
+def record(name):
+    """Считает событие в памяти процесса, без обращения к кешу."""
+    with _lock:
+        _counts[name] += 1
+
+
+def flush(**kwargs):
+    """Переносит счётчики процесса в общий кеш; вызывается по
+    request_finished, чтобы не ходить в кеш на каждое событие."""
+    with _lock:
+        events = dict(_counts)
+        _counts.clear()
+    for name, count in events.items():
+        key = STATS_KEY.format(name)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, None):
+                cache.incr(key, count)
+
+
+def read(names, reset=False):
+    """Значения счётчиков по именам; отсутствующие равны нулю."""
+    flush()
+    keys = {name: STATS_KEY.format(name) for name in names}
+    values = cache.get_many(keys.values())
+    if reset:
+        cache.delete_many(keys.values())
+    return {name: values.get(key, 0) for name, key in keys.items()}
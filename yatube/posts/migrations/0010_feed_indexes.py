@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:35
+
+from django.db import migrations, models, transaction
+from django.db.models import Count, Min
+
+BATCH_SIZE = 1000
+
+
+def dedupe_follows(apps, schema_editor):
+    Counter = apps.get_model('posts', 'Counter')
+    Follow = apps.get_model('posts', 'Follow')
+    duplicates = (
+        Follow.objects.order_by()
+        .values('user_id', 'author_id')
+        .annotate(copies=Count('id'), keep_id=Min('id'))
+        .filter(copies__gt=1)
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for pair in duplicates:
+        batch.append(pair)
+        if len(batch) == BATCH_SIZE:
+            _drop_copies(Counter, Follow, batch)
+            batch = []
+    if batch:
+        _drop_copies(Counter, Follow, batch)
+
+
+def _drop_copies(Counter, Follow, pairs):
+    with transaction.atomic():
+        for pair in pairs:
+            Follow.objects.filter(
+                user_id=pair['user_id'],
+                author_id=pair['author_id'],
+            ).exclude(id=pair['keep_id']).delete()
+        # Сигналы в миграциях не работают: сбрасываем счётчики подписок,
+        # они пересчитаются при первом чтении.
+        Counter.objects.filter(
+            kind='followers',
+            object_id__in={pair['author_id'] for pair in pairs},
+        ).delete()
+        Counter.objects.filter(
+            kind='following',
+            object_id__in={pair['user_id'] for pair in pairs},
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('posts', '0009_post_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_follows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', 'id'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', 'id'], name='post_group_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
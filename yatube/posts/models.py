@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .querycache import CachedQuerySet
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 FIRST_LETTER = 15
 
@@ -39,6 +42,10 @@ class Post(models.Model):
         verbose_name='Дата публикации',
         db_index=True,
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.PROTECT,
@@ -56,13 +63,38 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        blank=True,
+        storage=ContentAddressedStorage(),
+    )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False,
     )
 
+    objects = CachedQuerySet.as_manager()
+
     class Meta:
         ordering = (
             '-pub_date',
         )
+        indexes = (
+            models.Index(
+                fields=('author', '-pub_date', 'id'),
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', 'id'),
+                name='post_group_pub_date_idx',
+            ),
+        )
         verbose_name = 'Публикация'
         verbose_name_plural = 'Публикации'
 
@@ -91,6 +123,12 @@ class Comment(models.Model):
     )
 
     class Meta:
+        indexes = (
+            models.Index(
+                fields=('post', 'created'),
+                name='comment_post_created_idx',
+            ),
+        )
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -111,5 +149,138 @@ class Follow(models.Model):
     )
 
     class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow',
+            ),
+        )
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+
+
+class Counter(models.Model):
+    AUTHOR_POSTS = 'author_posts'
+    GROUP_POSTS = 'group_posts'
+    POST_COMMENTS = 'post_comments'
+    FOLLOWERS = 'followers'
+    FOLLOWING = 'following'
+    KIND_CHOICES = (
+        (AUTHOR_POSTS, 'Посты автора'),
+        (GROUP_POSTS, 'Посты группы'),
+        (POST_COMMENTS, 'Комментарии к посту'),
+        (FOLLOWERS, 'Подписчики'),
+        (FOLLOWING, 'Подписки'),
+    )
+
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        verbose_name='Что считаем',
+    )
+    object_id = models.PositiveIntegerField(
+        verbose_name='Объект',
+    )
+    value = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Значение',
+    )
+
+    class Meta:
+        unique_together = (
+            ('kind', 'object_id'),
+        )
+        verbose_name = 'Счётчик'
+        verbose_name_plural = 'Счётчики'
+
+    def __str__(self):
+        return f'{self.kind}:{self.object_id}={self.value}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        unique_together = (
+            ('user', 'post'),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date'),
+                name='timeline_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx',
+            ),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+
+class PostTerm(models.Model):
+    term = models.CharField(
+        max_length=64,
+        verbose_name='Слово',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='terms',
+        verbose_name='Пост',
+    )
+    weight = models.PositiveSmallIntegerField(
+        verbose_name='Сколько раз встречается',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        unique_together = (
+            ('term', 'post'),
+        )
+        verbose_name = 'Слово поиска'
+        verbose_name_plural = 'Поисковый индекс'
+
+    def __str__(self):
+        return self.term
+
+
+class MediaFile(models.Model):
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Путь к файлу',
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок',
+    )
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
@@ -0,0 +1,271 @@
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+CURSOR_ORDERING = ('-pub_date', '-pk')
+COMMENT_ORDERING = ('created', 'pk')
+FORWARD = 'n'
+BACKWARD = 'p'
+# Границы BIGINT: большее число в курсоре база не сравнит (OverflowError).
+MIN_ID, MAX_ID = -2 ** 63, 2 ** 63 - 1
+
+
+def elided_page_range(number, num_pages, on_each_side=3, on_ends=2):
+    """Номера страниц вокруг текущей и по краям; None — пропуск «…».
+
+    Как Paginator.get_elided_page_range из Django 3.2: длина списка не
+    зависит от числа страниц.
+    """
+    if num_pages <= (on_each_side + on_ends) * 2:
+        return list(range(1, num_pages + 1))
+    window = []
+    if number > on_each_side + on_ends + 2:
+        window += range(1, on_ends + 1)
+        window.append(None)
+        window += range(number - on_each_side, number + 1)
+    else:
+        window += range(1, number + 1)
+    if number < num_pages - on_each_side - on_ends - 1:
+        window += range(number + 1, number + on_each_side + 1)
+        window.append(None)
+        window += range(num_pages - on_ends + 1, num_pages + 1)
+    else:
+        window += range(number + 1, num_pages + 1)
+    return window
+
+
+def pack_cursor(direction, *key):
+    """Непрозрачный токен: направление и значения ключа сортировки."""
+    parts = [
+        value.isoformat() if isinstance(value, datetime) else str(value)
+        for value in key
+    ]
+    return urlsafe_base64_encode(force_bytes('|'.join([direction, *parts])))
+
+
+def unpack_cursor(token, *parsers):
+    """(direction, *ключ) или None для битого токена.
+
+    parsers разбирают части ключа по порядку (parse_moment, parse_id) и
+    бросают ValueError на негодном значении.
+    """
+    try:
+        direction, *parts = force_str(
+            urlsafe_base64_decode(token)
+        ).split('|')
+        if direction not in (FORWARD, BACKWARD) or (
+            len(parts) != len(parsers)
+        ):
+            return None
+        return (direction, *(
+            parse(part) for parse, part in zip(parsers, parts)
+        ))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.utc)
+    return moment
+
+
+def parse_id(value):
+    number = int(value)
+    if not MIN_ID <= number <= MAX_ID:
+        raise ValueError(value)
+    return number
+
+
+def encode_cursor(post, direction=FORWARD):
+    """Непрозрачный токен позиции в ленте: направление, дата и id поста."""
+    return pack_cursor(direction, post.pub_date, post.pk)
+
+
+def decode_cursor(token):
+    """Возвращает (direction, pub_date, pk) или None для битого токена."""
+    return unpack_cursor(token, parse_moment, parse_id)
+
+
+class CursorPage(Page):
+    """Страница ленты без номера: навигация только по соседним курсорам."""
+
+    page_window = ()
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = (
+            paginator.encode(object_list[-1], FORWARD) if has_next else None
+        )
+        self.previous_cursor = (
+            paginator.encode(object_list[0], BACKWARD)
+            if has_previous else None
+        )
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} posts>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_page_number(self):
+        return None
+
+    def previous_page_number(self):
+        return None
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+def seek(queryset, position, pk='pk'):
+    """Запрос строк после позиции курсора в порядке листания.
+
+    Вперёд строки идут от новых к старым, назад — от старых к новым.
+    pk — поле с id поста, если queryset читает не сами посты.
+    """
+    if position is None:
+        return queryset.order_by('-pub_date', f'-{pk}')
+    direction, pub_date, value = position
+    if direction == FORWARD:
+        return queryset.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, **{f'{pk}__lt': value})
+        ).order_by('-pub_date', f'-{pk}')
+    return queryset.filter(
+        Q(pub_date__gt=pub_date)
+        | Q(pub_date=pub_date, **{f'{pk}__gt': value})
+    ).order_by('pub_date', pk)
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод с поиском по ключу (pub_date, id) вместо OFFSET.
+
+    Каждая страница читает per_page + 1 строк от позиции курсора, поэтому
+    стоимость запроса не зависит от глубины листания.
+    """
+
+    def __init__(self, object_list, per_page, **kwargs):
+        super().__init__(
+            object_list.order_by(*CURSOR_ORDERING), per_page, **kwargs
+        )
+
+    def encode(self, post, direction):
+        return encode_cursor(post, direction)
+
+    def decode(self, token):
+        return decode_cursor(token)
+
+    def page_for_cursor(self, token):
+        position = self.decode(token) if token else None
+        rows = self.fetch(position, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if position is None or position[0] == FORWARD:
+            page_obj = CursorPage(rows, self, has_more, position is not None)
+        else:
+            rows.reverse()
+            page_obj = CursorPage(rows, self, True, has_more)
+        page_obj.cursor = token if position is not None else None
+        return page_obj
+
+    def fetch(self, position, limit):
+        return list(seek(self.object_list, position)[:limit])
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Курсорный вывод k-путевым слиянием нескольких упорядоченных лент.
+
+    Ленты — курсорные пагинаторы; из каждой читается не больше limit
+    строк, слияние идёт по тому же ключу (pub_date, id), поэтому курсоры
+    совместимы с CursorPaginator.
+    """
+
+    def __init__(self, streams, per_page, **kwargs):
+        self.streams = streams
+        Paginator.__init__(self, streams[0].object_list, per_page, **kwargs)
+
+    def fetch(self, position, limit):
+        merged = heapq.merge(
+            *(stream.fetch(position, limit) for stream in self.streams),
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=position is None or position[0] == FORWARD,
+        )
+        return list(islice(merged, limit))
+
+
+class CommentPaginator(CursorPaginator):
+    """Комментарии от старых к новым по ключу (created, id)."""
+
+    def __init__(self, object_list, per_page, **kwargs):
+        Paginator.__init__(
+            self, object_list.order_by(*COMMENT_ORDERING), per_page, **kwargs
+        )
+
+    def encode(self, comment, direction):
+        return pack_cursor(direction, comment.created, comment.pk)
+
+    def fetch(self, position, limit):
+        comments = self.object_list
+        if position is not None:
+            direction, created, pk = position
+            if direction == FORWARD:
+                comments = comments.filter(
+                    Q(created__gt=created) | Q(created=created, pk__gt=pk)
+                )
+            else:
+                comments = comments.filter(
+                    Q(created__lt=created) | Q(created=created, pk__lt=pk)
+                ).reverse()
+        return list(comments[:limit])
+
+
+def get_feed_page(object_list, per_page, page_number=None, cursor=None,
+                  count=None):
+    """Страница ленты: по курсору, если он передан, иначе по номеру.
+
+    Номерные страницы остаются для старых ссылок; у них тоже есть курсоры
+    соседних страниц, чтобы дальше листать уже без OFFSET. Если известно
+    число постов (count), пагинатор не делает SELECT COUNT(*).
+    """
+    if cursor:
+        return CursorPaginator(object_list, per_page).page_for_cursor(cursor)
+    paginator = Paginator(object_list.order_by(*CURSOR_ORDERING), per_page)
+    if count is not None:
+        paginator.count = count
+    return numbered_page(paginator, page_number)
+
+
+def numbered_page(paginator, page_number):
+    """Страница по номеру с окном номеров и курсорами соседних страниц."""
+    page_obj = paginator.get_page(page_number)
+    page_obj.page_window = elided_page_range(
+        page_obj.number, paginator.num_pages
+    )
+    page_obj.next_cursor = (
+        encode_cursor(page_obj[len(page_obj) - 1], FORWARD)
+        if page_obj.has_next() else None
+    )
+    page_obj.previous_cursor = (
+        encode_cursor(page_obj[0], BACKWARD)
+        if page_obj.has_previous() else None
+    )
+    return page_obj
@@ -0,0 +1,118 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import QuerySet
+
+from . import metrics
+from .cache import fresh_version
+
+HIT, MISS = 'hit', 'miss'
+RESULT_KEY = 'querycache:result:{}'
+TABLE_KEY = 'querycache:table:{}'
+STATS_NAME = 'querycache:{}:{}'
+
+
+class CachedQuerySet(QuerySet):
+    """QuerySet, результаты которого можно кешировать по требованию.
+
+    qs.cache('index') кладёт строки (и COUNT) в кеш под хешем
+    скомпилированного SQL с параметрами. Запись помечена версиями таблиц,
+    из которых читает запрос; сохранение или удаление любой модели этих
+    таблиц сдвигает версию, и старые записи больше не совпадают.
+    Таймаут берётся из QUERY_CACHE_TIMEOUTS по имени запроса.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_name = None
+
+    def cache(self, name):
+        if name not in settings.QUERY_CACHE_TIMEOUTS:
+            raise ValueError(f'Запрос {name} нет в QUERY_CACHE_TIMEOUTS')
+        clone = self._chain()
+        clone._cache_name = name
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_name = self._cache_name
+        return clone
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._cache_name:
+            self._result_cache = self._cached(
+                'rows', lambda: list(self._iterable_class(self))
+            )
+        super()._fetch_all()
+
+    def count(self):
+        if self._result_cache is None and self._cache_name:
+            return self._cached('count', super().count)
+        return super().count()
+
+    def _cached(self, kind, compute):
+        try:
+            sql, params = self.query.get_compiler(self.db).as_sql()
+        except EmptyResultSet:
+            return compute()
+        raw = f'{self.db}|{kind}|{self._iterable_class.__name__}|{sql}|'
+        key = RESULT_KEY.format(
+            hashlib.sha1((raw + repr(params)).encode()).hexdigest()
+        )
+        tables = sorted(
+            {join.table_name for join in self.query.alias_map.values()}
+        )
+        versions, stored = table_versions(tables, key)
+        if stored is not None and stored[0] == versions:
+            metrics.record(STATS_NAME.format(self._cache_name, HIT))
+            return stored[1]
+        metrics.record(STATS_NAME.format(self._cache_name, MISS))
+        value = compute()
+        cache.set(
+            key,
+            (versions, value),
+            settings.QUERY_CACHE_TIMEOUTS[self._cache_name],
+        )
+        return value
+
+
+def table_versions(tables, key):
+    """Текущие версии таблиц и запись под key за один запрос к кешу.
+
+    Отсутствующие версии заводятся заново.
+    """
+    keys = {table: TABLE_KEY.format(table) for table in tables}
+    found = cache.get_many([key, *keys.values()])
+    versions = {}
+    for table, table_key in keys.items():
+        if table_key not in found:
+            cache.add(table_key, fresh_version(), None)
+            found[table_key] = cache.get(table_key)
+        versions[table] = found[table_key]
+    return versions, found.get(key)
+
+
+def invalidate_tables(*tables):
+    """Сдвигает версии таблиц; для изменений в обход сигналов моделей."""
+    for table in tables:
+        key = TABLE_KEY.format(table)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, fresh_version(), None)
+
+
+def queryset_stats(reset=False):
+    """Попадания и промахи каждого кешируемого запроса."""
+    names = {
+        (name, event): STATS_NAME.format(name, event)
+        for name in settings.QUERY_CACHE_TIMEOUTS
+        for event in (HIT, MISS)
+    }
+    values = metrics.read(names.values(), reset)
+    stats = {}
+    for (name, event), stat in names.items():
+        stats.setdefault(name, {})[event] = values[stat]
+    return stats
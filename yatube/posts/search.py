@@ -0,0 +1,103 @@
+import re
+from collections import Counter
+
+from django.db.models import Count, Max, Q, Sum
+
+from .feeds import feed_posts
+from .models import Post, PostTerm
+from .paginator import (FORWARD, CursorPaginator, pack_cursor, parse_id,
+                        parse_moment, unpack_cursor)
+
+TERM_RE = re.compile(r'\w+')
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+MAX_WEIGHT = 32767
+
+
+def tokenize(text):
+    """Слова текста с числом вхождений: нижний регистр, ё -> е."""
+    terms = Counter(
+        term[:MAX_TERM_LENGTH]
+        for term in TERM_RE.findall(text.lower().replace('ё', 'е'))
+        if len(term) >= MIN_TERM_LENGTH
+    )
+    return {term: min(weight, MAX_WEIGHT) for term, weight in terms.items()}
+
+
+def index_post(post):
+    """Пересобирает слова одного поста в обратном индексе."""
+    PostTerm.objects.filter(post=post).delete()
+    PostTerm.objects.bulk_create(
+        PostTerm(
+            term=term,
+            post_id=post.pk,
+            weight=weight,
+            pub_date=post.pub_date,
+        )
+        for term, weight in tokenize(post.text).items()
+    )
+
+
+def matches(query):
+    """Посты, содержащие все слова запроса, с оценкой релевантности.
+
+    Строки вида {'post_id', 'score', 'published'}: score — сумма вхождений
+    слов запроса, published — дата поста для сортировки по свежести.
+    """
+    terms = tokenize(query)
+    rows = (
+        PostTerm.objects.filter(term__in=terms)
+        .values('post_id')
+        .annotate(
+            matched=Count('term'),
+            score=Sum('weight'),
+            published=Max('pub_date'),
+        )
+        .filter(matched=len(terms))
+    )
+    # Пустой запрос сохраняет аннотации: по ним сортирует SearchPaginator.
+    return rows if terms else rows.none()
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорный вывод результатов поиска по ключу (score, дата, id)."""
+
+    ordering = ('-score', '-published', '-post_id')
+
+    def __init__(self, query, per_page, **kwargs):
+        super().__init__(Post.objects.none(), per_page, **kwargs)
+        self.matches = matches(query)
+
+    def encode(self, post, direction):
+        return pack_cursor(
+            direction, post.search_score, post.pub_date, post.pk
+        )
+
+    def decode(self, token):
+        return unpack_cursor(token, parse_id, parse_moment, parse_id)
+
+    def fetch(self, position, limit):
+        rows = self.matches.order_by(*self.ordering)
+        if position is not None:
+            direction, score, pub_date, pk = position
+            if direction == FORWARD:
+                rows = rows.filter(
+                    Q(score__lt=score)
+                    | Q(score=score, published__lt=pub_date)
+                    | Q(score=score, published=pub_date, post_id__lt=pk)
+                )
+            else:
+                rows = rows.filter(
+                    Q(score__gt=score)
+                    | Q(score=score, published__gt=pub_date)
+                    | Q(score=score, published=pub_date, post_id__gt=pk)
+                ).reverse()
+        rows = list(rows.values_list('post_id', 'score')[:limit])
+        posts = feed_posts().in_bulk([post_id for post_id, _ in rows])
+        found = []
+        for post_id, score in rows:
+            post = posts.get(post_id)
+            if post is not None:
+                post.search_score = score
+                found.append(post)
+        return found
@@ -0,0 +1,195 @@
+from django.core.signals import request_finished
+from django.core.files.images import get_image_dimensions
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+
+from . import (counters, metrics, querycache, search, stats, thumbnails,
+               timeline)
+from .cache import (bump_feed_version, cached_lookups, forget_objects,
+                    forget_posts, now_and_on_commit, object_keys)
+from .follows import invalidate_graph
+from .models import Comment, Follow, Group, Post, User
+from .storage import acquire
+
+COUNTED_MODELS = (Comment, Follow, Post)
+# Подписки меняют только ленту подписчика, её ключ содержит версию графа.
+FEED_MODELS = (Comment, Group, Post)
+# Таблицы, которые читают кешируемые запросы. Приёмник на все модели
+# отключил бы быстрое удаление индекса и таймлайна.
+QUERY_CACHE_MODELS = (Follow, Group, Post, User)
+
+
+def remember_counted(sender, instance, **kwargs):
+    # Берём значения из __dict__, чтобы не подгружать отложенные поля.
+    instance._counted = {
+        attr: instance.__dict__[attr]
+        for attr, _ in counters.counted_fields(sender)
+        if attr in instance.__dict__
+    }
+
+
+def count_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_counted', {})
+    for attr, kind in counters.counted_fields(sender):
+        if created:
+            counters.shift(kind, getattr(instance, attr), 1)
+            continue
+        if attr not in previous:
+            continue
+        current = getattr(instance, attr)
+        if previous[attr] != current:
+            counters.shift(kind, previous[attr], -1)
+            counters.shift(kind, current, 1)
+    remember_counted(sender, instance)
+
+
+def count_deleted(sender, instance, **kwargs):
+    for attr, kind in counters.counted_fields(sender):
+        counters.shift(kind, getattr(instance, attr), -1)
+
+
+def remember_image(sender, instance, **kwargs):
+    # Запоминаем имя уже сохранённого файла, а не новой загрузки.
+    image = instance.__dict__.get('image')
+    if isinstance(image, FieldFile):
+        image = image.name if image._committed else None
+    elif not isinstance(image, str):
+        image = None
+    instance._stored_image = image or None
+
+
+def track_image_references(sender, instance, raw, **kwargs):
+    # Ссылки меняются, только если сменилось имя: повторная загрузка тех
+    # же байтов даёт то же имя и ничего не трогает.
+    if raw or 'image' not in instance.__dict__:
+        return
+    previous = getattr(instance, '_stored_image', None)
+    current = instance.image.name or None
+    if previous != current:
+        if current:
+            acquire_image(current)
+        if previous:
+            release_image(previous)
+    remember_image(sender, instance)
+
+
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        release_image(instance.image.name)
+
+
+def acquire_image(name):
+    storage = Post.image.field.storage
+    if storage.is_hashed(name):
+        transaction.on_commit(lambda: acquire(name))
+
+
+def release_image(name):
+    storage = Post.image.field.storage
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+def record_image_size(sender, instance, raw, **kwargs):
+    # Размеры читаются из только что загруженного файла, до его записи в
+    # хранилище; сохранённые картинки больше не открываются.
+    if raw or 'image' not in instance.__dict__:
+        return
+    image = instance.image
+    if not image:
+        instance.image_width = instance.image_height = None
+    elif not image._committed:
+        instance.image_width, instance.image_height = (
+            get_image_dimensions(image)
+        )
+
+
+def push_post(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+def index_post(sender, instance, raw, **kwargs):
+    if not raw and 'text' in instance.__dict__:
+        search.index_post(instance)
+
+
+def backfill_timeline(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+def prune_timeline(sender, instance, **kwargs):
+    # Счётчик подписчиков уже сдвинут count_deleted.
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.unpull(instance.author_id)
+
+
+def invalidate_follow_graph(sender, instance, **kwargs):
+    invalidate_graph(instance.user_id)
+
+
+def forget_latest_post(sender, instance, **kwargs):
+    stats.forget_latest_post(instance.author_id)
+
+
+def remember_object_keys(sender, instance, **kwargs):
+    instance._object_keys = object_keys(instance)
+
+
+def forget_cached_object(sender, instance, **kwargs):
+    # Старые ключи нужны, если поменялся slug или имя пользователя.
+    keys = set(getattr(instance, '_object_keys', ()))
+    forget_objects(keys.union(object_keys(instance)))
+    remember_object_keys(sender, instance)
+
+
+def forget_group_posts(sender, instance, **kwargs):
+    # SET_NULL обнуляет group у постов одним UPDATE без сигналов, и
+    # закешированные посты остались бы со ссылкой на удалённую группу.
+    forget_posts(instance.post_set.values_list('pk', flat=True))
+
+
+def invalidate_table(sender, **kwargs):
+    table = sender._meta.db_table
+    now_and_on_commit(lambda: querycache.invalidate_tables(table))
+
+
+def invalidate_feeds(sender, **kwargs):
+    now_and_on_commit(bump_feed_version)
+
+
+def connect():
+    for model in COUNTED_MODELS:
+        post_init.connect(remember_counted, sender=model)
+        post_save.connect(count_saved, sender=model)
+        post_delete.connect(count_deleted, sender=model)
+    pre_save.connect(record_image_size, sender=Post)
+    post_init.connect(remember_image, sender=Post)
+    post_save.connect(track_image_references, sender=Post)
+    post_delete.connect(release_deleted_image, sender=Post)
+    post_save.connect(push_post, sender=Post)
+    post_save.connect(index_post, sender=Post)
+    post_save.connect(forget_latest_post, sender=Post)
+    post_delete.connect(forget_latest_post, sender=Post)
+    post_save.connect(backfill_timeline, sender=Follow)
+    post_delete.connect(prune_timeline, sender=Follow)
+    post_save.connect(invalidate_follow_graph, sender=Follow)
+    post_delete.connect(invalidate_follow_graph, sender=Follow)
+    for model in cached_lookups():
+        post_init.connect(remember_object_keys, sender=model)
+        post_save.connect(forget_cached_object, sender=model)
+        post_delete.connect(forget_cached_object, sender=model)
+    pre_delete.connect(forget_group_posts, sender=Group)
+    for model in FEED_MODELS:
+        post_save.connect(invalidate_feeds, sender=model)
+        post_delete.connect(invalidate_feeds, sender=model)
+    for model in QUERY_CACHE_MODELS:
+        post_save.connect(invalidate_table, sender=model)
+        post_delete.connect(invalidate_table, sender=model)
+    request_finished.connect(thumbnails.forget_prefetched)
+    request_finished.connect(thumbnails.release_unsubmitted)
+    request_finished.connect(metrics.flush)
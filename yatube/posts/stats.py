@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .counters import author_counts
+from .models import Post
+
+LATEST_POST_KEY = 'posts:author_latest:{}'
+
+
+def latest_post_time(author_id):
+    """Дата последнего поста автора; кешируется ненадолго и сбрасывается
+    сигналами при публикации и удалении постов."""
+    key = LATEST_POST_KEY.format(author_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0]
+    latest = (
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date')
+        .values_list('pub_date', flat=True)
+        .first()
+    )
+    cache.set(key, (latest,), settings.AUTHOR_STATS_TIMEOUT)
+    return latest
+
+
+def forget_latest_post(author_id):
+    cache.delete(LATEST_POST_KEY.format(author_id))
+
+
+def author_stats(author):
+    """Число постов, подписчиков и подписок из счётчиков и дата последнего
+    поста — без чтения ленты автора."""
+    return {
+        **author_counts(author),
+        'latest_post': latest_post_time(author.pk),
+    }
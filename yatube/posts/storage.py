@@ -0,0 +1,134 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.apps import apps
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME_RE = re.compile(
+    r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$'
+)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы называются по sha256 содержимого и раскладываются по
+    вложенным каталогам ab/cd/. Одинаковые загрузки хранятся один раз,
+    число ссылок на файл ведёт модель MediaFile.
+
+    Ссылку берёт не запись файла, а фиксация поста, который на него
+    сослался (posts.signals): файл от откатившегося сохранения остаётся
+    без ссылок и достаётся сборщику мусора.
+    """
+
+    shard_depth = 2
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        shards = [
+            digest[2 * level:2 * level + 2]
+            for level in range(self.shard_depth)
+        ]
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), *shards, digest + extension
+        )
+
+    def is_hashed(self, name):
+        return bool(HASHED_NAME_RE.search(name))
+
+    def get_available_name(self, name, max_length=None):
+        # Имя всё равно заменит хэш в _save.
+        return name
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if not self.exists(name):
+            self._publish(name, content)
+        return name
+
+    def _publish(self, name, content):
+        """Пишет файл во временный рядом и атомарно ссылается на него
+        под итоговым именем.
+
+        Если имя уже занято, тот же файл успел записать параллельный
+        запрос: содержимое по определению одинаковое.
+        """
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0)
+            try:
+                os.makedirs(
+                    directory, self.directory_permissions_mode, exist_ok=True
+                )
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.')
+        try:
+            with os.fdopen(descriptor, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(temp_path)
+
+    def delete(self, name):
+        """Снимает ссылку; файл удаляется вместе с последней."""
+        MediaFile = apps.get_model('posts', 'MediaFile')
+        if not MediaFile.objects.filter(name=name).exists():
+            # Файл из времён до хранилища: удаляем, если на него никто
+            # больше не ссылается.
+            Post = apps.get_model('posts', 'Post')
+            if Post.objects.filter(image=name).exists():
+                return
+            try:
+                super().delete(name)
+            except SuspiciousFileOperation:
+                # Путь вне MEDIA_ROOT: это не наш файл.
+                pass
+            return
+        if release(name):
+            super().delete(name)
+
+
+def acquire(name, count=1):
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    files = MediaFile.objects.filter(name=name)
+    if files.update(references=F('references') + count):
+        return
+    try:
+        with transaction.atomic():
+            MediaFile.objects.create(name=name, references=count)
+    except IntegrityError:
+        files.update(references=F('references') + count)
+
+
+def release(name):
+    """Снимает ссылку на файл; True, если ссылок больше нет."""
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    with transaction.atomic():
+        MediaFile.objects.filter(name=name, references__gt=0).update(
+            references=F('references') - 1
+        )
+        deleted, _ = MediaFile.objects.filter(
+            name=name, references=0
+        ).delete()
+    return bool(deleted)
@@ -0,0 +1,45 @@
+from django import template
+from django.conf import settings
+from sorl.thumbnail import get_thumbnail
+
+from ..images import served_formats
+from ..thumbnails import PlaceholderImage, variant_geometries
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(image, geometry_string, sizes=None, **options):
+    """<picture> с srcset по ширинам во всех форматах.
+
+    Данные о готовых вариантах берутся из хранилища миниатюр, файлы не
+    проверяются; ещё не нарезанные варианты в srcset не попадают.
+    """
+    if not image:
+        return {}
+    variants = variant_geometries(
+        geometry_string, getattr(image.instance, 'image_width', None)
+    )
+    sources = []
+    for image_format in served_formats():
+        format_options = dict(options)
+        if image_format:
+            format_options['format'] = image_format
+        srcset = []
+        for _, variant_geometry in variants:
+            thumbnail = get_thumbnail(
+                image, variant_geometry, **format_options
+            )
+            if not isinstance(thumbnail, PlaceholderImage):
+                srcset.append(f'{thumbnail.url} {thumbnail.width}w')
+        sources.append({
+            'type': f'image/{image_format.lower()}' if image_format else '',
+            'srcset': ', '.join(srcset),
+        })
+    fallback = sources.pop()
+    return {
+        'sources': [source for source in sources if source['srcset']],
+        'srcset': fallback['srcset'],
+        'sizes': sizes or settings.POST_IMAGE_SIZES,
+        'image': get_thumbnail(image, geometry_string, **options),
+    }
@@ -0,0 +1,164 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models.deletion import Collector
+from django.http import Http404
+from django.test import override_settings, TestCase
+
+from ..cache import attach_related, fetch_objects, get_cached_or_404
+from ..checks import check_shared_cache
+from ..feeds import feed_posts
+from ..models import Group, Post, PostTerm, TimelineEntry
+from ..querycache import HIT, MISS, queryset_stats
+
+User = get_user_model()
+
+
+class ObjectCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Test title', slug='slug')
+        cls.post = Post.objects.create(
+            text='Test text', author=cls.author, group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_read_through(self):
+        """Повторное чтение объектов не ходит в базу"""
+        lookups = [
+            (Post, 'pk', [self.post.pk]),
+            (Group, 'slug', [self.group.slug]),
+            (User, 'username', [self.author.username, 'missing']),
+        ]
+        with self.assertNumQueries(3):
+            fetch_objects(lookups)
+        with self.assertNumQueries(0):
+            found = fetch_objects(lookups)
+        self.assertEqual(found[Post, 'pk'], {self.post.pk: self.post})
+        self.assertEqual(found[Group, 'slug'], {'slug': self.group})
+        self.assertEqual(found[User, 'username'], {'auth': self.author})
+        user = User.objects.create_user(username='missing')
+        self.assertEqual(get_cached_or_404(User, username='missing'), user)
+
+    def test_attach_related(self):
+        """Автор и группа поста подставляются из кеша"""
+        post = get_cached_or_404(Post, pk=self.post.pk)
+        attach_related([post], 'author', 'group')
+        post = get_cached_or_404(Post, pk=self.post.pk)
+        with self.assertNumQueries(0):
+            attach_related([post], 'author', 'group')
+            self.assertEqual(post.author.username, 'auth')
+            self.assertEqual(post.group.title, 'Test title')
+
+    def test_invalidated_on_save(self):
+        """Правка объекта сбрасывает его ключи, включая старый slug"""
+        get_cached_or_404(Group, slug='slug')
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed'
+        group.title = 'New title'
+        group.save()
+        with self.assertRaises(Http404):
+            get_cached_or_404(Group, slug='slug')
+        self.assertEqual(
+            get_cached_or_404(Group, slug='renamed').title, 'New title'
+        )
+
+    def test_invalidated_on_delete(self):
+        """Удалённый пост больше не достаётся из кеша"""
+        get_cached_or_404(Post, pk=self.post.pk)
+        Post.objects.get(pk=self.post.pk).delete()
+        with self.assertRaises(Http404):
+            get_cached_or_404(Post, pk=self.post.pk)
+
+    def test_group_delete_forgets_posts(self):
+        """После удаления группы пост из кеша её больше не ссылается"""
+        get_cached_or_404(Post, pk=self.post.pk)
+        Group.objects.get(pk=self.group.pk).delete()
+        self.assertIsNone(get_cached_or_404(Post, pk=self.post.pk).group_id)
+
+
+class QueryCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Test title', slug='slug')
+        cls.post = Post.objects.create(
+            text='Test text', author=cls.author, group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        queryset_stats(reset=True)
+
+    def group_feed(self):
+        return feed_posts().filter(group=self.group).cache('group_posts')
+
+    def test_results_cached(self):
+        """Строки и COUNT кешируемого запроса читаются из кеша"""
+        with self.assertNumQueries(2):
+            self.assertEqual(list(self.group_feed()), [self.post])
+            self.assertEqual(self.group_feed().count(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(self.group_feed()), [self.post])
+            self.assertEqual(self.group_feed().count(), 1)
+        self.assertEqual(
+            queryset_stats()['group_posts'], {HIT: 2, MISS: 2}
+        )
+
+    def test_stats_command(self):
+        """Команда выводит счётчики, собранные в процессе"""
+        list(self.group_feed())
+        list(self.group_feed())
+        stdout = StringIO()
+        call_command('query_cache_stats', reset=True, stdout=stdout,
+                     stderr=StringIO())
+        self.assertIn('group_posts: hit: 1, miss: 1', stdout.getvalue())
+        self.assertEqual(queryset_stats()['group_posts'], {HIT: 0, MISS: 0})
+
+    def test_uncached_by_default(self):
+        """Без cache() запрос каждый раз идёт в базу"""
+        list(feed_posts())
+        with self.assertNumQueries(1):
+            list(feed_posts())
+
+    def test_invalidated_by_joined_table(self):
+        """Правка группы сбрасывает ленты, которые читают её таблицу"""
+        list(self.group_feed())
+        Group.objects.filter(pk=self.group.pk).get().save()
+        with self.assertNumQueries(1):
+            list(self.group_feed())
+
+    def test_index_tables_fast_deleted(self):
+        """Строки индекса и таймлайна удаляются без выборки по одной"""
+        collector = Collector(using='default')
+        for model in (PostTerm, TimelineEntry):
+            with self.subTest(model=model):
+                self.assertTrue(
+                    collector.can_fast_delete(model.objects.all())
+                )
+
+    def test_invalidated_on_new_post(self):
+        """Новый пост сразу виден в закешированной ленте"""
+        list(self.group_feed())
+        post = Post.objects.create(
+            text='Новый пост', author=self.author, group=self.group,
+        )
+        self.assertIn(post, list(self.group_feed()))
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_local_cache_warned(self):
+        """check --deploy предупреждает о кеше внутри процесса"""
+        self.assertEqual(
+            [error.id for error in check_shared_cache(None)], ['posts.W001']
+        )
+        memcached = {'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        }}
+        with override_settings(CACHES=memcached):
+            self.assertEqual(check_shared_cache(None), [])
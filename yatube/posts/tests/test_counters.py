@@ -0,0 +1,73 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..counters import author_counts, get_count
+from ..models import Comment, Counter, Follow, Group, Post
+
+User = get_user_model()
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Test title', slug='slug')
+        cls.group_2 = Group.objects.create(title='Test title 2', slug='slug2')
+
+    def test_lazy_count(self):
+        """Отсутствующий счётчик считается по таблице"""
+        Post.objects.bulk_create(
+            Post(text=f'Test text {index}', author=self.author)
+            for index in range(3)
+        )
+        self.assertEqual(author_counts(self.author)['posts'], 3)
+        self.assertTrue(
+            Counter.objects.filter(
+                kind=Counter.AUTHOR_POSTS,
+                object_id=self.author.pk,
+            ).exists()
+        )
+
+    def test_post_counters_follow_changes(self):
+        """Счётчики постов меняются при создании, правке и удалении"""
+        self.assertEqual(get_count(Counter.GROUP_POSTS, self.group.pk), 0)
+        self.assertEqual(get_count(Counter.GROUP_POSTS, self.group_2.pk), 0)
+        post = Post.objects.create(
+            text='Test text', author=self.author, group=self.group,
+        )
+        self.assertEqual(get_count(Counter.GROUP_POSTS, self.group.pk), 1)
+        post = Post.objects.get(pk=post.pk)
+        post.group = self.group_2
+        post.save()
+        self.assertEqual(get_count(Counter.GROUP_POSTS, self.group.pk), 0)
+        self.assertEqual(get_count(Counter.GROUP_POSTS, self.group_2.pk), 1)
+        self.assertEqual(author_counts(self.author)['posts'], 1)
+        post.delete()
+        self.assertEqual(get_count(Counter.GROUP_POSTS, self.group_2.pk), 0)
+        self.assertEqual(author_counts(self.author)['posts'], 0)
+
+    def test_comment_and_follow_counters(self):
+        """Счётчики комментариев и подписок"""
+        post = Post.objects.create(text='Test text', author=self.author)
+        self.assertEqual(get_count(Counter.POST_COMMENTS, post.pk), 0)
+        self.assertEqual(author_counts(self.author)['followers'], 0)
+        Comment.objects.create(post=post, author=self.reader, text='Text')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(get_count(Counter.POST_COMMENTS, post.pk), 1)
+        self.assertEqual(author_counts(self.author)['followers'], 1)
+        self.assertEqual(author_counts(self.reader)['following'], 1)
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(author_counts(self.author)['followers'], 0)
+        self.assertEqual(author_counts(self.reader)['following'], 0)
+
+    def test_recount_command(self):
+        """Команда исправляет разошедшиеся счётчики"""
+        Post.objects.create(text='Test text', author=self.author)
+        author_counts(self.author)
+        Counter.objects.filter(kind=Counter.AUTHOR_POSTS).update(value=42)
+        call_command('recount_counters', chunk_size=1, stdout=StringIO())
+        self.assertEqual(author_counts(self.author)['posts'], 1)
@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..follows import common_follows, follow, is_following, unfollow
+from ..models import Follow
+
+User = get_user_model()
+
+
+class FollowGraphTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.other_reader = User.objects.create_user(username='other')
+        cls.authors = [
+            User.objects.create_user(username=f'author{index}')
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_check_without_queries(self):
+        """Тёплая проверка подписки не обращается к базе"""
+        follow(self.reader, self.authors[0])
+        self.assertTrue(is_following(self.reader.pk, self.authors[0].pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                is_following(self.reader.pk, self.authors[0].pk)
+            )
+            self.assertFalse(
+                is_following(self.reader.pk, self.authors[1].pk)
+            )
+
+    def test_invalidation(self):
+        """Подписка и отписка сбрасывают закэшированный граф"""
+        self.assertFalse(is_following(self.reader.pk, self.authors[0].pk))
+        follow(self.reader, self.authors[0])
+        self.assertTrue(is_following(self.reader.pk, self.authors[0].pk))
+        unfollow(self.reader, self.authors[0])
+        self.assertFalse(is_following(self.reader.pk, self.authors[0].pk))
+        Follow.objects.create(user=self.reader, author=self.authors[1])
+        self.assertTrue(is_following(self.reader.pk, self.authors[1].pk))
+
+    def test_common_follows(self):
+        """Общие подписки двух читателей"""
+        for author in self.authors:
+            follow(self.reader, author)
+        for author in self.authors[1:]:
+            follow(self.other_reader, author)
+        self.assertEqual(
+            common_follows(self.reader.pk, self.other_reader.pk),
+            [author.pk for author in self.authors[1:]],
+        )
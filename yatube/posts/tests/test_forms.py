@@ -1,12 +1,15 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, override_settings, TestCase
 from django.urls import reverse
+from PIL import Image
 
+from ..images import ingest
 from ..models import Comment, Group, Post
 
 User = get_user_model()
@@ -18,6 +21,7 @@ SMALL_GIF = (
     b'\x02\x00\x01\x00\x00\x02\x02\x0C'
     b'\x0A\x00\x3B'
 )
+STORED_NAME = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
 UPLOADED_1 = SimpleUploadedFile(
     name='small.gif',
     content=SMALL_GIF,
@@ -88,7 +92,7 @@ class TestPostCreateForm(TestCase):
         self.assertEqual(last_posts.text, create_text)
         self.assertEqual(last_posts.group, self.group)
         self.assertEqual(last_posts.author, self.post.author)
-        self.assertEqual(last_posts.image, f'posts/{UPLOADED_1.name}')
+        self.assertRegex(last_posts.image.name, STORED_NAME)
 
     def test_post_edit(self):
         """Проверка редактирование поста"""
@@ -117,7 +121,106 @@ class TestPostCreateForm(TestCase):
         self.assertEqual(editing_post.text, edit_text)
         self.assertEqual(editing_post.group, self.group_2)
         self.assertEqual(editing_post.author, self.post.author)
-        self.assertEqual(editing_post.image, f'posts/{UPLOADED_2.name}')
+        self.assertRegex(editing_post.image.name, STORED_NAME)
+
+    def test_post_edit_uses_fresh_row(self):
+        """Правка не возвращает поля из устаревшего кеша"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        Post.objects.filter(pk=self.post.pk).update(image='posts/moved.gif')
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Test new text'},
+        )
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).image.name, 'posts/moved.gif'
+        )
+
+    @override_settings(POST_IMAGE_MAX_SIZE=100)
+    def test_post_image_ingest(self):
+        """Картинка ужимается, теряет EXIF и сохраняется прогрессивной"""
+        photo = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (400, 200), 'red').save(photo, 'JPEG', exif=exif)
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Фото',
+                'image': SimpleUploadedFile(
+                    name='photo.jpg',
+                    content=photo.getvalue(),
+                    content_type='image/jpeg',
+                ),
+            },
+        )
+        post = Post.objects.get(text='Фото')
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (100, 50))
+            self.assertNotIn('exif', stored.info)
+            self.assertTrue(stored.info.get('progressive'))
+
+    @override_settings(POST_IMAGE_MAX_SIZE=100)
+    def test_ingest_png_orientation(self):
+        """PNG ужимается до поворота по EXIF и теряет метаданные"""
+        picture = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new('RGB', (400, 200), 'red').save(picture, 'PNG', exif=exif)
+        stored = ingest(SimpleUploadedFile('picture.png', picture.getvalue()))
+        with Image.open(stored) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertNotIn('exif', image.info)
+
+    def test_read_only_format_reencoded(self):
+        """Картинка в формате только для чтения сохраняется как PNG"""
+        xpm = (
+            b'/* XPM */\nstatic char *image[] = {\n"2 1 2 1",\n'
+            b'"a c #FF0000",\n"b c #0000FF",\n"ab"\n};\n'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'XPM',
+                'image': SimpleUploadedFile('picture.xpm', xpm),
+            },
+        )
+        post = Post.objects.get(text='XPM')
+        self.assertRegex(post.image.name, r'\.png$')
+        with Image.open(post.image) as image:
+            self.assertEqual((image.format, image.size), ('PNG', (2, 1)))
+
+    @override_settings(POST_IMAGE_MAX_SIZE=100)
+    def test_ingest_animation(self):
+        """Анимация ужимается покадрово и остаётся анимацией"""
+        animation = BytesIO()
+        frames = [Image.new('P', (400, 200), color) for color in (1, 2)]
+        frames[0].save(
+            animation, 'GIF', save_all=True, append_images=frames[1:],
+            duration=50, loop=0,
+        )
+        stored = ingest(SimpleUploadedFile('anim.gif', animation.getvalue()))
+        with Image.open(stored) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertEqual(image.n_frames, 2)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        """Картинка больше порога пикселей отклоняется до декодирования"""
+        picture = BytesIO()
+        Image.new('RGB', (20, 10), 'red').save(picture, 'PNG')
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Огромная',
+                'image': SimpleUploadedFile('huge.png', picture.getvalue()),
+            },
+        )
+        self.assertFormError(
+            response, 'form', 'image', 'Не удалось обработать картинку.'
+        )
+        self.assertFalse(Post.objects.filter(text='Огромная').exists())
 
     def test_authorized_user_comment(self):
         """
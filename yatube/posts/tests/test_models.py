@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError
 from django.test import TestCase
 
-from ..models import Comment, FIRST_LETTER, Group, Post
+from ..models import Comment, FIRST_LETTER, Follow, Group, Post
 
 User = get_user_model()
 
@@ -116,3 +117,17 @@ class CommentModelTest(TestCase):
         записано значение поля comment.text.
         """
         self.assertEquals(self.comment.text, str(self.comment))
+
+
+class FollowModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+
+    def test_follow_unique(self):
+        """Нельзя подписаться на автора дважды."""
+        Follow.objects.create(user=self.user, author=self.author)
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=self.user, author=self.author)
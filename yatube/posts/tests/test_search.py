@@ -0,0 +1,97 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from ..models import Post, PostTerm
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.old = Post.objects.create(text='Ёжик и туман', author=cls.user)
+        cls.strong = Post.objects.create(
+            text='Туман, туман и снова туман',
+            author=cls.user,
+        )
+        cls.fresh = Post.objects.create(text='Утренний туман', author=cls.user)
+        Post.objects.create(text='Ясное небо', author=cls.user)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response.context['page_obj']
+
+    def test_rank_by_relevance_and_recency(self):
+        """Сначала более релевантные, при равенстве — более свежие"""
+        self.assertEqual(
+            [post.pk for post in self.search('ТУМАН')],
+            [self.strong.pk, self.fresh.pk, self.old.pk],
+        )
+
+    def test_all_terms_required(self):
+        """Найдены только посты со всеми словами запроса"""
+        self.assertEqual(
+            [post.pk for post in self.search('ежик туман')],
+            [self.old.pk],
+        )
+
+    def test_query_without_terms(self):
+        """Запрос без слов из двух букв даёт пустую выдачу"""
+        for query in ('т', 'я', '!!'):
+            with self.subTest(query=query):
+                self.assertEqual(len(self.search(query)), 0)
+
+    def test_index_follows_edits(self):
+        """Индекс обновляется при правке и удалении поста"""
+        post = Post.objects.get(pk=self.fresh.pk)
+        post.text = 'Вечерний закат'
+        post.save()
+        self.assertEqual(len(self.search('туман')), 2)
+        self.assertEqual(len(self.search('закат')), 1)
+        post.delete()
+        self.assertFalse(PostTerm.objects.filter(term='закат').exists())
+
+    @override_settings(POSTS_PER_PAGE=2)
+    def test_cursor_pages(self):
+        """Результаты листаются курсорами"""
+        first = self.search('туман')
+        second = self.search('туман', cursor=first.next_cursor)
+        self.assertEqual([post.pk for post in second], [self.old.pk])
+        back = self.search('туман', cursor=second.previous_cursor)
+        self.assertEqual(
+            [post.pk for post in back],
+            [post.pk for post in first],
+        )
+
+    def test_overflowing_cursor(self):
+        """Курсор с числом за пределами BIGINT считается битым"""
+        cursor = urlsafe_base64_encode(
+            force_bytes(f'n|{10 ** 22}|2020-01-01T00:00:00+00:00|1')
+        )
+        self.assertEqual(len(self.search('туман', cursor=cursor)), 3)
+
+    def test_admin_uses_index(self):
+        """Поиск в админке идёт по тому же индексу"""
+        admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='password',
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'ёжик'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list),
+            [self.old],
+        )
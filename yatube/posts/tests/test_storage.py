@@ -0,0 +1,276 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import override_settings, TestCase, TransactionTestCase
+
+from ..cache import get_cached_or_404
+from ..feeds import feed_posts
+from ..models import MediaFile, Post
+from ..thumbnails import generate_thumbnail
+
+User = get_user_model()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.storage = Post.image.field.storage
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name):
+        return Post.objects.create(
+            author=self.author,
+            text='Пост',
+            image=ContentFile(SMALL_GIF, name=name),
+        )
+
+    def test_concurrent_identical_upload(self):
+        """Файл, появившийся между exists() и записью, считается сохранённым"""
+        name = self.storage.save('first.gif', ContentFile(SMALL_GIF))
+        with mock.patch.object(self.storage, 'exists', return_value=False):
+            self.assertEqual(
+                self.storage.save('second.gif', ContentFile(SMALL_GIF)), name
+            )
+        directory = os.path.dirname(self.storage.path(name))
+        self.assertEqual(os.listdir(directory), [os.path.basename(name)])
+
+    def test_migrate_media_storage(self):
+        """Команда переносит старые файлы и не трогает перенесённые"""
+        flat_name = FileSystemStorage().save(
+            'posts/old.gif', ContentFile(SMALL_GIF)
+        )
+        posts = [
+            Post.objects.create(author=self.author, text='Старый пост')
+            for _ in range(2)
+        ]
+        Post.objects.update(image=flat_name)
+        cache.clear()
+        get_cached_or_404(Post, pk=posts[0].pk)
+        list(feed_posts().cache('index'))
+        call_command('migrate_media_storage', chunk_size=1, stdout=StringIO())
+        names = {
+            post.image.name for post in Post.objects.filter(
+                pk__in=[post.pk for post in posts]
+            )
+        }
+        self.assertEqual(len(names), 1)
+        new_name = names.pop()
+        self.assertTrue(self.storage.is_hashed(new_name))
+        self.assertTrue(self.storage.exists(new_name))
+        self.assertFalse(
+            os.path.exists(os.path.join(TEMP_MEDIA_ROOT, flat_name))
+        )
+        self.assertEqual(
+            MediaFile.objects.get(name=new_name).references, 2
+        )
+        self.assertEqual(
+            get_cached_or_404(Post, pk=posts[0].pk).image.name, new_name
+        )
+        self.assertEqual(
+            {post.image.name for post in feed_posts().cache('index')},
+            {new_name},
+        )
+
+    def test_collect_media_garbage(self):
+        """Сборщик удаляет файлы без ссылок, dry-run ничего не трогает"""
+        post = self.create_post('kept.gif')
+        thumbnail = generate_thumbnail(
+            post.image.name, '320x113', {'crop': 'center'}
+        )
+        orphans = [
+            FileSystemStorage().save(name, ContentFile(SMALL_GIF))
+            for name in ('posts/ab/cd/orphan.gif', 'cache/00/11/stale.jpg')
+        ]
+        output = StringIO()
+        call_command(
+            'collect_media_garbage', dry_run=True, min_age=0, stdout=output
+        )
+        self.assertIn(
+            f'файлов: 2, байт: {2 * len(SMALL_GIF)}', output.getvalue()
+        )
+        for name in orphans:
+            self.assertTrue(self.storage.exists(name))
+        call_command(
+            'collect_media_garbage', min_age=0, pause=0, stdout=StringIO()
+        )
+        for name in orphans:
+            self.assertFalse(self.storage.exists(name))
+        self.assertTrue(self.storage.exists(post.image.name))
+        self.assertTrue(self.storage.exists(thumbnail.name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageReferenceTests(TransactionTestCase):
+    """Ссылки берутся при фиксации поста, поэтому нужны настоящие
+    транзакции."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='auth')
+        self.storage = Post.image.field.storage
+
+    def create_post(self, name):
+        return Post.objects.create(
+            author=self.author,
+            text='Пост',
+            image=ContentFile(SMALL_GIF, name=name),
+        )
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые загрузки хранятся одним шардированным файлом"""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(self.storage.is_hashed(first.image.name))
+        self.assertEqual(
+            MediaFile.objects.get(name=first.image.name).references, 2
+        )
+
+    def test_file_removed_with_last_reference(self):
+        """Файл удаляется, только когда на него не осталось ссылок"""
+        name = self.create_post('first.gif').image.name
+        self.create_post('second.gif')
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    def test_same_bytes_reuploaded(self):
+        """Повторная загрузка тех же байтов не добавляет ссылку"""
+        post = self.create_post('first.gif')
+        post.image = ContentFile(SMALL_GIF, name='again.gif')
+        post.save()
+        self.assertEqual(
+            MediaFile.objects.get(name=post.image.name).references, 1
+        )
+
+    def test_rolled_back_save_takes_no_reference(self):
+        """Откатившееся сохранение не оставляет ссылку на файл"""
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                name = self.create_post('first.gif').image.name
+                raise DatabaseError
+        self.assertTrue(self.storage.exists(name))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaServingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.name = Post.image.field.storage.save(
+            'posts/served.gif', ContentFile(SMALL_GIF)
+        )
+        cls.url = settings.MEDIA_URL + cls.name
+        cls.legacy_url = settings.MEDIA_URL + FileSystemStorage().save(
+            'posts/legacy.gif', ContentFile(SMALL_GIF)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_file_with_cache_headers(self):
+        """Файл отдаётся целиком с ETag и вечным кешированием"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), SMALL_GIF)
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(response['ETag'])
+
+    def test_if_none_match(self):
+        """Совпавший ETag даёт 304 без тела"""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        """Range отдаёт нужный кусок, невозможный диапазон — 416"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), SMALL_GIF[2:6])
+        self.assertEqual(
+            response['Content-Range'], f'bytes 2-5/{len(SMALL_GIF)}'
+        )
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), SMALL_GIF[-3:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertNotIn('Cache-Control', response)
+
+    def test_legacy_name_revalidated(self):
+        """Старое нехешированное имя не кешируется навсегда"""
+        response = self.client.get(self.legacy_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_forbidden_paths(self):
+        """Файлы вне разрешённых каталогов и несуществующие — 404"""
+        for path in ('posts/../secret', 'other/file.gif', 'posts/none.gif',
+                     'posts/.hidden', 'posts'):
+            with self.subTest(path=path):
+                response = self.client.get(settings.MEDIA_URL + path)
+                self.assertEqual(response.status_code, 404)
+
+    @override_settings(MEDIA_ACCEL='x-accel-redirect')
+    def test_accel_redirect(self):
+        """С nginx Django только проверяет файл и отдаёт заголовок"""
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            settings.MEDIA_ACCEL_PREFIX + self.name,
+        )
+        self.assertEqual(response.content, b'')
+
+    def test_front_server_headers_quoted(self):
+        """Нелатинское имя уходит фронт-серверу в %-кодировке"""
+        name = FileSystemStorage().save(
+            'posts/кот.gif', ContentFile(SMALL_GIF)
+        )
+        url = settings.MEDIA_URL + name
+        with self.settings(MEDIA_ACCEL='x-accel-redirect'):
+            self.assertEqual(
+                self.client.get(url)['X-Accel-Redirect'],
+                settings.MEDIA_ACCEL_PREFIX + 'posts/%D0%BA%D0%BE%D1%82.gif',
+            )
+        with self.settings(MEDIA_ACCEL='x-sendfile'):
+            self.assertEqual(
+                self.client.get(url)['X-Sendfile'],
+                quote(os.path.join(TEMP_MEDIA_ROOT, name)),
+            )
@@ -0,0 +1,223 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import override_settings, TestCase
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from ..cache import feed_version, get_cached_or_404
+from ..models import Post
+from ..thumbnails import (HIT, MISS, WAIT, PlaceholderImage,
+                          forget_prefetched, generate_thumbnail,
+                          post_thumbnail_options, prefetch_thumbnails,
+                          queue_post_thumbnails, release_unsubmitted,
+                          thumbnail_stats, variant_geometries, wait_for)
+
+User = get_user_model()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username='auth'),
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=SMALL_GIF,
+                content_type='image/gif',
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        release_unsubmitted()
+        cache.clear()
+        thumbnail_stats(reset=True)
+        forget_prefetched()
+
+    def test_miss_returns_placeholder(self):
+        """Без готовой миниатюры рендер получает заглушку и ставит задачу"""
+        thumbnail = get_thumbnail(self.post.image, '960x339', crop='center')
+        self.assertIsInstance(thumbnail, PlaceholderImage)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        self.assertTrue(
+            thumbnail.url.endswith(settings.THUMBNAIL_PLACEHOLDER)
+        )
+        self.assertEqual(thumbnail_stats()[MISS], 1)
+
+    def test_single_flight(self):
+        """Пока миниатюру режут, остальные получают заглушку без задачи"""
+        get_thumbnail(self.post.image, '960x339', crop='center')
+        thumbnail = get_thumbnail(self.post.image, '960x339', crop='center')
+        self.assertIsInstance(thumbnail, PlaceholderImage)
+        self.assertEqual(
+            thumbnail_stats(), {HIT: 0, MISS: 1, WAIT: 1}
+        )
+        generate_thumbnail(
+            self.post.image.name, '960x339', {'crop': 'center'}
+        )
+        get_thumbnail(self.post.image, '960x339', crop='center')
+        self.assertEqual(thumbnail_stats()[HIT], 1)
+
+    def test_stats_command_warns_about_local_cache(self):
+        """Команда предупреждает, что в локальном кеше счётчики не видны"""
+        stdout, stderr = StringIO(), StringIO()
+        call_command('thumbnail_stats', stdout=stdout, stderr=stderr)
+        self.assertIn('hit: 0', stdout.getvalue())
+        self.assertIn('YATUBE_MEMCACHED', stderr.getvalue())
+
+    def test_rolled_back_queue_releases_locks(self):
+        """Блокировки неотправленных задач снимаются к концу запроса"""
+        self.assertTrue(queue_post_thumbnails(self.post))
+        self.assertEqual(queue_post_thumbnails(self.post), 0)
+        release_unsubmitted()
+        self.assertTrue(queue_post_thumbnails(self.post))
+
+    def test_waiter_does_not_evict_metadata(self):
+        """Ожидание чужой нарезки не сбрасывает общий кеш метаданных"""
+        generate_thumbnail(
+            self.post.image.name, '960x339', {'crop': 'center'}
+        )
+        thumbnail = default.backend.thumbnail_file(
+            self.post.image, '960x339', {'crop': 'center'}
+        )
+        key = add_prefix(thumbnail.key)
+        self.assertIsNotNone(default.kvstore.cache.get(key))
+        self.assertTrue(wait_for(thumbnail))
+        self.assertIsNotNone(default.kvstore.cache.get(key))
+
+    def test_upload_queues_every_size_once(self):
+        """Загрузка ставит в очередь все размеры без повторов"""
+        expected = post_thumbnail_options(self.post.image_width)
+        self.assertEqual(
+            queue_post_thumbnails(self.post), len(list(expected))
+        )
+        self.assertEqual(queue_post_thumbnails(self.post), 0)
+
+    def test_generated_thumbnail_is_served(self):
+        """Готовая миниатюра отдаётся из хранилища ключей, а пост и
+        версия лент не меняются"""
+        updated = self.post.updated
+        version = feed_version()
+        generate_thumbnail(
+            self.post.image.name, '960x339', {'crop': 'center'}
+        )
+        thumbnail = get_thumbnail(self.post.image, '960x339', crop='center')
+        self.assertNotIsInstance(thumbnail, PlaceholderImage)
+        self.assertTrue(thumbnail.url.startswith(settings.MEDIA_URL))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.updated, updated)
+        self.assertEqual(feed_version(), version)
+
+    def test_prefetch_marks_ready_posts(self):
+        """Пост готов, только когда нарезаны все его варианты"""
+        post = Post.objects.get(pk=self.post.pk)
+        prefetch_thumbnails([post])
+        self.assertFalse(post.thumbnails_ready)
+        for geometry_string, options in post_thumbnail_options(
+            post.image_width
+        ):
+            generate_thumbnail(post.image.name, geometry_string, options)
+        forget_prefetched()
+        prefetch_thumbnails([post])
+        self.assertTrue(post.thumbnails_ready)
+
+    def test_prefetch_resolves_page_in_one_query(self):
+        """Метаданные страницы читаются одним запросом, рендер — без них"""
+        generate_thumbnail(
+            self.post.image.name, '960x339', {'crop': 'center'}
+        )
+        cache.clear()
+        with self.assertNumQueries(1):
+            prefetch_thumbnails([self.post])
+        with self.assertNumQueries(0):
+            thumbnail = get_thumbnail(
+                self.post.image, '960x339', crop='center'
+            )
+        self.assertNotIsInstance(thumbnail, PlaceholderImage)
+        forget_prefetched()
+        with self.assertNumQueries(0):
+            prefetch_thumbnails([self.post])
+
+    def test_image_size_recorded_on_upload(self):
+        """Размеры картинки сохраняются вместе с постом"""
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (2, 1)
+        )
+
+    def test_backfill_image_sizes(self):
+        """Команда дозаполняет размеры у старых постов"""
+        Post.objects.update(image_width=None, image_height=None)
+        cache.clear()
+        stale = get_cached_or_404(Post, pk=self.post.pk)
+        call_command('backfill_image_sizes', chunk_size=1, stdout=StringIO())
+        self.assertEqual(
+            Post.objects.values_list('image_width', 'image_height').get(),
+            (2, 1),
+        )
+        post = get_cached_or_404(Post, pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertGreater(post.updated, stale.updated)
+
+    def test_variant_geometries(self):
+        """Варианты сохраняют пропорции и не шире исходника"""
+        self.assertEqual(
+            variant_geometries('960x339', 1000),
+            [(320, '320x113'), (640, '640x226'), (960, '960x339')],
+        )
+        self.assertEqual(
+            variant_geometries('960x339', 2),
+            [(320, '320x113'), (960, '960x339')],
+        )
+
+    def test_generate_thumbnails_is_idempotent(self):
+        """Команда нарезает варианты один раз и перезапускается без работы"""
+        output = StringIO()
+        call_command('generate_thumbnails', stdout=output)
+        expected = len(list(post_thumbnail_options(self.post.image_width)))
+        self.assertIn(f'Нарезано миниатюр: {expected}', output.getvalue())
+        output = StringIO()
+        call_command(
+            'generate_thumbnails', start_pk=0, chunk_size=1, stdout=output
+        )
+        self.assertIn('Нарезано миниатюр: 0', output.getvalue())
+
+    def test_picture_srcset(self):
+        """Тег перечисляет в srcset только готовые варианты"""
+        template = Template(
+            '{% load post_images %}'
+            '{% post_picture post.image "960x339" crop="center" %}'
+        )
+        html = template.render(Context({'post': self.post}))
+        self.assertNotIn('srcset', html)
+        # В TestCase on_commit не срабатывает, как при откате: блокировки
+        # снимает конец запроса.
+        release_unsubmitted()
+        call_command('generate_thumbnails', stdout=StringIO())
+        html = template.render(Context({'post': self.post}))
+        self.assertIn(' 320w, ', html)
+        self.assertIn(' 960w', html)
+        self.assertIn('sizes="', html)
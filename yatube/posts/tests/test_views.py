@@ -6,10 +6,15 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 
-from ..models import Follow, Group, Post
+from ..cache import feed_version
+from ..models import Comment, Follow, Group, Post, TimelineEntry
 
 User = get_user_model()
 FIRST_NUMBER = 0
@@ -251,6 +256,205 @@ class PaginatorViewsTest(TestCase):
                 SECOND_PAGE_SIZE,
             )
 
+    def test_cursor_pages(self):
+        """Курсоры ведут на соседние страницы без повторов и пропусков"""
+        url_names = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for urls in url_names:
+            with self.subTest(urls=urls):
+                first_page = self.client.get(urls).context['page_obj']
+                second_page = self.client.get(
+                    urls, {'cursor': first_page.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(len(second_page), SECOND_PAGE_SIZE)
+                self.assertFalse(second_page.has_next())
+                seen = [post.pk for post in first_page]
+                seen += [post.pk for post in second_page]
+                self.assertEqual(
+                    seen,
+                    list(
+                        Post.objects.order_by(
+                            '-pub_date', '-pk'
+                        ).values_list('pk', flat=True)
+                    ),
+                )
+                back_page = self.client.get(
+                    urls, {'cursor': second_page.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    [post.pk for post in back_page],
+                    [post.pk for post in first_page],
+                )
+                self.assertFalse(back_page.has_previous())
+
+    @override_settings(POSTS_PER_PAGE=1)
+    def test_elided_page_window(self):
+        """Ссылки только на края и соседей текущей страницы"""
+        response = self.client.get(reverse('posts:index'), {'page': 8})
+        self.assertEqual(
+            response.context['page_obj'].page_window,
+            [1, 2, None, 5, 6, 7, 8, 9, 10, 11, None, 14, 15],
+        )
+        self.assertNotContains(response, 'page=4"')
+        self.assertContains(response, 'page=15"', count=2)
+        cursor_page = self.client.get(
+            reverse('posts:index'),
+            {'cursor': response.context['page_obj'].next_cursor},
+        ).context['page_obj']
+        self.assertEqual(list(cursor_page.page_window), [])
+
+    def test_broken_cursor(self):
+        """Битый курсор открывает первую страницу"""
+        overflow = urlsafe_base64_encode(
+            force_bytes(f'n|2020-01-01T00:00:00+00:00|{10 ** 22}')
+        )
+        for cursor in ('broken', overflow):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    reverse('posts:index'), {'cursor': cursor}
+                )
+                self.assertEqual(
+                    len(response.context['page_obj']),
+                    PAGE_SIZE,
+                )
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentsPageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username='auth'),
+            text='Обсуждаемый пост',
+        )
+        Comment.objects.bulk_create(
+            Comment(
+                post=cls.post,
+                author=User.objects.create_user(username=f'reader{index}'),
+                text=f'Комментарий {index}',
+            )
+            for index in range(5)
+        )
+        cls.comment_ids = list(
+            cls.post.comments.order_by('created', 'pk')
+            .values_list('pk', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comments_paginated(self):
+        """Под постом первая пачка комментариев и курсор на следующую"""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.pk for comment in comments], self.comment_ids[:3]
+        )
+        self.assertContains(response, comments.next_cursor)
+        fragment = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': comments.next_cursor},
+        )
+        self.assertTemplateUsed(fragment, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(fragment, 'base.html')
+        rest = fragment.context['comments']
+        self.assertEqual(
+            [comment.pk for comment in rest], self.comment_ids[3:]
+        )
+        self.assertFalse(rest.has_next())
+        self.assertContains(fragment, 'reader4')
+
+    def test_comment_authors_joined(self):
+        """Авторы комментариев приходят одним запросом со страницей"""
+        url = reverse(
+            'posts:post_comments', kwargs={'post_id': self.post.pk}
+        )
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_missing_post_comments(self):
+        """Комментарии несуществующего поста отдают 404"""
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Test title', slug='slug')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def count_queries(self, url):
+        self.authorized_client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(url)
+        return len(queries)
+
+    def test_fixed_query_count(self):
+        """Число запросов ленты не зависит от числа постов на странице"""
+        url_names = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:follow_index'),
+        )
+        Post.objects.create(
+            text='Test text',
+            author=self.user,
+            group=self.group,
+        )
+        single = [self.count_queries(url) for url in url_names]
+        for index in range(PAGE_SIZE):
+            Post.objects.create(
+                text=f'Test text {index}',
+                author=self.user,
+                group=self.group,
+            )
+        full = [self.count_queries(url) for url in url_names]
+        self.assertEqual(single, full)
+
+    def test_post_detail_fixed_query_count(self):
+        """Страница поста не читает ленту автора ради счётчика постов"""
+        post = Post.objects.create(
+            text='Test text',
+            author=self.user,
+            group=self.group,
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        single = self.count_queries(url)
+        Post.objects.bulk_create(
+            Post(text=f'Test text {index}', author=self.user)
+            for index in range(ALL_PAGE_SIZE)
+        )
+        self.assertEqual(self.count_queries(url), single)
+
+    def test_post_detail_author_stats(self):
+        """Статистика автора сбрасывается при публикации поста"""
+        post = Post.objects.create(text='Test text', author=self.user)
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        stats = self.authorized_client.get(url).context['stats']
+        self.assertEqual(stats['posts'], 1)
+        self.assertEqual(stats['latest_post'], post.pub_date)
+        latest = Post.objects.create(text='Новый пост', author=self.user)
+        stats = self.authorized_client.get(url).context['stats']
+        self.assertEqual(stats['posts'], 2)
+        self.assertEqual(stats['latest_post'], latest.pub_date)
+
 
 class CacheViewsTest(TestCase):
     @classmethod
@@ -259,6 +463,7 @@ class CacheViewsTest(TestCase):
         cls.user = User.objects.create_user(username='auth')
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
 
     def test_cache_index(self):
@@ -269,7 +474,7 @@ class CacheViewsTest(TestCase):
             author=self.user,
         )
         response = self.guest_client.get(page).content
-        Post.objects.all().delete()
+        Post.objects.update(text='Changed text')
         response_1 = self.guest_client.get(page).content
         self.assertEqual(response, response_1)
 
@@ -281,10 +486,66 @@ class CacheViewsTest(TestCase):
             author=self.user,
         )
         response = self.guest_client.get(page).content
+        Post.objects.update(text='Changed text')
         cache.clear()
         response_1 = self.guest_client.get(page).content
         self.assertNotEqual(response, response_1)
 
+    def test_cache_invalidated_on_delete(self):
+        """Удаление поста сразу сбрасывает кэш ленты"""
+        page = reverse('posts:index')
+        Post.objects.create(
+            text='Test text',
+            author=self.user,
+        )
+        response = self.guest_client.get(page).content
+        Post.objects.all().delete()
+        response_1 = self.guest_client.get(page).content
+        self.assertNotEqual(response, response_1)
+        self.assertNotIn('Test text', response_1.decode())
+
+    def test_cache_page_aware(self):
+        """Вторая страница не берётся из кэша первой"""
+        Post.objects.bulk_create(
+            Post(text=f'Test text {index}', author=self.user)
+            for index in range(ALL_PAGE_SIZE)
+        )
+        page = reverse('posts:index')
+        first = self.guest_client.get(page).content.decode()
+        second = self.guest_client.get(page, {'page': 2}).content.decode()
+        self.assertNotIn('Test text 0<', first)
+        self.assertIn('Test text 0<', second)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Edited post', author=cls.user)
+        cls.other_post = Post.objects.create(
+            text='Other post',
+            author=cls.user,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_edit_invalidates_only_edited_card(self):
+        """Правка поста сбрасывает кэш только его карточки"""
+        page = reverse('posts:index')
+        self.authorized_client.get(page)
+        Post.objects.filter(pk=self.other_post.pk).update(text='Stale text')
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Fresh text'},
+        )
+        content = self.authorized_client.get(page).content.decode()
+        self.assertIn('Fresh text', content)
+        self.assertIn('Other post', content)
+        self.assertNotIn('Stale text', content)
+
 
 class FollowerTest(TestCase):
     @classmethod
@@ -364,3 +625,164 @@ class FollowerTest(TestCase):
             reverse('posts:follow_index')
         ).context['page_obj']
         self.assertEqual(len(response), 0)
+
+    def test_new_post_pushed_to_timeline(self):
+        """Новый пост автора попадает в ленту подписчика"""
+        Follow.objects.create(
+            user=self.follower,
+            author=self.author,
+        )
+        post = Post.objects.create(
+            author=self.author,
+            text='Test text follow',
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.follower,
+                post=post,
+            ).exists()
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.not_follower).exists()
+        )
+
+    def test_follow_keeps_other_feeds_cached(self):
+        """Подписка сбрасывает только ленту подписчика"""
+        Post.objects.create(author=self.author, text='Test text follow')
+        Post.objects.create(author=self.not_follower, text='Already followed')
+        Follow.objects.create(user=self.follower, author=self.not_follower)
+        follow_page = reverse('posts:follow_index')
+        self.assertNotContains(
+            self.authorized_client.get(follow_page), 'Test text follow'
+        )
+        version = feed_version()
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author})
+        )
+        self.assertEqual(feed_version(), version)
+        self.assertContains(
+            self.authorized_client.get(follow_page), 'Test text follow'
+        )
+
+    def test_unfollow_prunes_timeline(self):
+        """После отписки посты автора пропадают из ленты"""
+        Post.objects.create(
+            author=self.author,
+            text='Test text follow',
+        )
+        self.authorized_client.get(
+            reverse(
+                'posts:profile_follow',
+                kwargs={'username': self.author},
+            )
+        )
+        self.authorized_client.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.author},
+            )
+        )
+        response = self.authorized_client.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists()
+        )
+
+    def test_timeline_seeks_on_entries(self):
+        """Страница ленты ищется по записям ленты без JOIN с постами"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Test {index}')
+            for index in range(PAGE_SIZE + 1)
+        ]
+        url = reverse('posts:follow_index')
+        with CaptureQueriesContext(connection) as queries:
+            page_obj = self.authorized_client.get(url).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in page_obj],
+            [post.pk for post in reversed(posts)][:PAGE_SIZE],
+        )
+        timeline_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'posts_timelineentry' in query['sql']
+        ]
+        self.assertTrue(timeline_queries)
+        for sql in timeline_queries:
+            self.assertNotIn('posts_post', sql)
+        page_obj = self.authorized_client.get(
+            url, {'cursor': page_obj.next_cursor}
+        ).context['page_obj']
+        self.assertEqual([post.pk for post in page_obj], [posts[0].pk])
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=1)
+    def test_hybrid_feed(self):
+        """Посты популярного автора подмешиваются при чтении ленты"""
+        regular = User.objects.create_user(username='regular')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.not_follower, author=self.author)
+        Follow.objects.create(user=self.follower, author=regular)
+        pulled_post = Post.objects.create(author=self.author, text='Pulled')
+        pushed_post = Post.objects.create(author=regular, text='Pushed')
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=pulled_post).exists()
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response['X-Feed-Source'], 'hybrid')
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [pushed_post.pk, pulled_post.pk],
+        )
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=1)
+    def test_hybrid_feed_is_cursor_only(self):
+        """Слитая лента листается курсором, номер страницы не учитывается"""
+        regular = User.objects.create_user(username='regular')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.not_follower, author=self.author)
+        Follow.objects.create(user=self.follower, author=regular)
+        for index in range(PAGE_SIZE + 1):
+            Post.objects.create(author=self.author, text=f'Pulled {index}')
+        url = reverse('posts:follow_index')
+        first = self.authorized_client.get(url).context['page_obj']
+        numbered = self.authorized_client.get(
+            url, {'page': 2}
+        ).context['page_obj']
+        self.assertEqual(list(numbered), list(first))
+        self.assertIsNone(numbered.number)
+        self.assertIsNotNone(first.next_cursor)
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=1)
+    def test_unpulled_author_backfilled(self):
+        """Автор, опустившийся до порога, возвращается в ленты подписчиков"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.not_follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Pulled')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        Follow.objects.get(user=self.not_follower, author=self.author).delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.follower, post=post
+            ).exists()
+        )
+
+    def test_follow_json(self):
+        """POST-подписка отвечает состоянием и числом подписчиков"""
+        url = reverse('posts:profile_follow', kwargs={'username': self.author})
+        self.authorized_client.post(url)
+        response = self.authorized_client.post(url)
+        self.assertEqual(
+            response.json(),
+            {'following': True, 'followers': 1},
+        )
+        response = self.authorized_client.post(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.author},
+            )
+        )
+        self.assertEqual(
+            response.json(),
+            {'following': False, 'followers': 0},
+        )
@@ -0,0 +1,328 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.templatetags.static import static
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import metrics
+from .images import served_formats
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+HIT, MISS, WAIT = 'hit', 'miss', 'wait'
+LOCK_KEY = 'thumbnails:lock:{}'
+STATS_NAME = 'thumbnails:{}'
+
+_executor = None
+_executor_lock = threading.Lock()
+_prefetched = threading.local()
+_pending = set()
+_unsubmitted = threading.local()
+_pending_lock = threading.Lock()
+
+
+class PlaceholderImage(DummyImageFile):
+    """Заглушка нужного размера, пока миниатюра готовится в фоне."""
+
+    @property
+    def url(self):
+        return static(settings.THUMBNAIL_PLACEHOLDER)
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не режет картинки во время рендера страницы.
+
+    Готовая миниатюра берётся из хранилища ключей. Недостающую режет
+    только тот процесс, что первым взял её блокировку, — остальные ждут
+    THUMBNAIL_LOCK_WAIT секунд и отдают заглушку.
+    """
+
+    def thumbnail_file(self, file_, geometry_string, options):
+        # Те же имена и опции, что у ThumbnailBackend.get_thumbnail.
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        thumbnail = self.thumbnail_file(file_, geometry_string, dict(options))
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            metrics.record(STATS_NAME.format(HIT))
+            return cached
+        if acquire_lock(thumbnail):
+            metrics.record(STATS_NAME.format(MISS))
+            queue_thumbnail(
+                ImageFile(file_).name, geometry_string, options, thumbnail
+            )
+        else:
+            metrics.record(STATS_NAME.format(WAIT))
+            cached = wait_for(thumbnail)
+            if cached:
+                return cached
+        return PlaceholderImage(geometry_string)
+
+    def generate(self, file_, geometry_string, **options):
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+
+class ThumbnailStore(KVStore):
+    """Хранилище метаданных миниатюр: кеш, затем база.
+
+    Ключи, заранее прочитанные prefetch_thumbnails, отдаются из памяти до
+    конца запроса без обращений к кешу и базе.
+    """
+
+    def _get_raw(self, key):
+        prefetched = getattr(_prefetched, 'values', {})
+        if key in prefetched:
+            return prefetched[key]
+        return super()._get_raw(key)
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        getattr(_prefetched, 'values', {}).pop(key, None)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        prefetched = getattr(_prefetched, 'values', {})
+        for key in keys:
+            prefetched.pop(key, None)
+
+    def get_many_raw(self, keys):
+        """Значения ключей за один запрос к кешу и не больше одного к базе."""
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            stored = dict(
+                KVStoreModel.objects.filter(key__in=missing)
+                .values_list('key', 'value')
+            )
+            fetched = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(fetched)
+        return {
+            key: None if value == EMPTY_VALUE else value
+            for key, value in found.items()
+        }
+
+
+def variant_geometries(geometry_string, image_width=None):
+    """Геометрии ширинных вариантов миниатюры с теми же пропорциями.
+
+    Варианты шире исходной картинки не нужны; самый узкий и базовый
+    (его берёт src у <img>) есть всегда.
+    """
+    base_width, base_height = map(int, geometry_string.split('x'))
+    widths = {min(settings.POST_IMAGE_WIDTHS), base_width}
+    widths.update(
+        width for width in settings.POST_IMAGE_WIDTHS
+        if image_width is None or width <= image_width
+    )
+    return [
+        (width, f'{width}x{round(base_height * width / base_width)}')
+        for width in sorted(widths)
+    ]
+
+
+def post_thumbnail_options(image_width=None):
+    """Все пары (геометрия, опции), которые шаблоны берут у картинки."""
+    for geometry_string, options in settings.POST_THUMBNAILS:
+        for _, variant_geometry in variant_geometries(
+            geometry_string, image_width
+        ):
+            for image_format in served_formats():
+                variant = dict(options)
+                if image_format:
+                    variant['format'] = image_format
+                yield variant_geometry, variant
+
+
+def prefetch_thumbnails(posts):
+    """Читает метаданные всех миниатюр страницы одним пакетом.
+
+    Заодно отмечает у постов с картинкой thumbnails_ready — готовы ли все
+    варианты. Флаг входит в ключи кеша карточки и ленты, поэтому
+    фрагменты с заглушкой перерисуются, как только миниатюры дорежутся.
+    """
+    if not isinstance(default.kvstore, ThumbnailStore):
+        return
+    backend = default.backend
+    post_keys = [
+        (post, [
+            add_prefix(backend.thumbnail_file(
+                post.image, geometry_string, dict(options)
+            ).key)
+            for geometry_string, options in post_thumbnail_options(
+                post.image_width
+            )
+        ])
+        for post in posts if post.image
+    ]
+    keys = [key for _, keys in post_keys for key in keys]
+    if not keys:
+        return
+    found = default.kvstore.get_many_raw(keys)
+    values = getattr(_prefetched, 'values', {})
+    values.update(found)
+    _prefetched.values = values
+    for post, keys in post_keys:
+        post.thumbnails_ready = all(found.get(key) for key in keys)
+
+
+def forget_prefetched(**kwargs):
+    _prefetched.values = {}
+
+
+def drain():
+    """Дожидается всех поставленных в очередь миниатюр.
+
+    Запросы пул не ждут; это для тестов и кода, которому нужны готовые
+    файлы, например перед удалением временного MEDIA_ROOT.
+    """
+    with _pending_lock:
+        futures = list(_pending)
+    wait(futures)
+
+
+def _forget_future(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def acquire_lock(thumbnail):
+    """Блокировка нарезки миниатюры, общая для всех процессов через кеш."""
+    return cache.add(
+        LOCK_KEY.format(thumbnail.key), 1, settings.THUMBNAIL_LOCK_TIMEOUT
+    )
+
+
+def release_lock(thumbnail):
+    cache.delete(LOCK_KEY.format(thumbnail.key))
+
+
+def wait_for(thumbnail):
+    """Ждёт миниатюру, которую режет другой процесс; None по таймауту.
+
+    Опрашивается только ключ блокировки: общий кеш хранилища ключей
+    воркер обновит сам, когда сохранит миниатюру.
+    """
+    lock = LOCK_KEY.format(thumbnail.key)
+    deadline = time.monotonic() + settings.THUMBNAIL_LOCK_WAIT
+    while cache.get(lock) is not None:
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.05)
+    getattr(_prefetched, 'values', {}).pop(add_prefix(thumbnail.key), None)
+    return default.kvstore.get(thumbnail)
+
+
+def thumbnail_stats(reset=False):
+    """Сколько миниатюр нашлось сразу, сколько нарезано, сколько ждали."""
+    names = {event: STATS_NAME.format(event) for event in (HIT, MISS, WAIT)}
+    values = metrics.read(names.values(), reset)
+    return {event: values[name] for event, name in names.items()}
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def generate_thumbnail(name, geometry_string, options):
+    """Режет миниатюру; карточки с заглушкой сменят ключ сами, через
+    thumbnails_ready из prefetch_thumbnails."""
+    return default.backend.generate(
+        ImageFile(name, Post.image.field.storage), geometry_string, **options
+    )
+
+
+def _work(name, geometry_string, options, thumbnail):
+    try:
+        generate_thumbnail(name, geometry_string, options)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюру %s', name)
+    finally:
+        release_lock(thumbnail)
+        connections.close_all()
+
+
+def release_unsubmitted(**kwargs):
+    """Снимает блокировки задач, чья транзакция так и не зафиксировалась.
+
+    Вызывается по request_finished: к этому моменту on_commit либо
+    сработал, либо отброшен откатом.
+    """
+    thumbnails = getattr(_unsubmitted, 'thumbnails', {})
+    _unsubmitted.thumbnails = {}
+    for thumbnail in thumbnails.values():
+        release_lock(thumbnail)
+
+
+def queue_thumbnail(name, geometry_string, options, thumbnail):
+    """Ставит миниатюру в очередь после фиксации текущей транзакции.
+
+    Вызывающий уже держит блокировку thumbnail; её снимет задача, а при
+    откате — release_unsubmitted.
+    """
+    if not hasattr(_unsubmitted, 'thumbnails'):
+        _unsubmitted.thumbnails = {}
+    _unsubmitted.thumbnails[thumbnail.key] = thumbnail
+
+    def submit():
+        _unsubmitted.thumbnails.pop(thumbnail.key, None)
+        future = _get_executor().submit(
+            _work, name, geometry_string, options, thumbnail
+        )
+        with _pending_lock:
+            _pending.add(future)
+        future.add_done_callback(_forget_future)
+
+    transaction.on_commit(submit)
+
+
+def queue_post_thumbnails(post):
+    """Ставит в очередь все миниатюры картинки поста; число задач."""
+    if not post.image:
+        return 0
+    queued = 0
+    for geometry_string, options in post_thumbnail_options(
+        post.image_width
+    ):
+        thumbnail = default.backend.thumbnail_file(
+            post.image, geometry_string, dict(options)
+        )
+        if acquire_lock(thumbnail):
+            queue_thumbnail(
+                post.image.name, geometry_string, options, thumbnail
+            )
+            queued += 1
+    return queued
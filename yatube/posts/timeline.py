@@ -0,0 +1,189 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+
+from .counters import get_count
+from .feeds import feed_posts
+from .follows import followed_ids
+from .models import Counter, Follow, Post, TimelineEntry
+from .paginator import (CursorPaginator, MergedCursorPaginator,
+                        numbered_page, seek)
+
+PUSH = 'push'
+PULL = 'pull'
+HYBRID = 'hybrid'
+TIMELINE_ORDERING = ('-pub_date', '-post_id')
+
+
+class TimelinePaginator(CursorPaginator):
+    """Лента подписок по индексу (user, -pub_date).
+
+    Позиция курсора и номер страницы ищутся только по записям ленты, без
+    JOIN с постами; сами посты страницы читаются одним запросом по id.
+    """
+
+    def __init__(self, entries, per_page, **kwargs):
+        Paginator.__init__(
+            self,
+            entries.order_by(*TIMELINE_ORDERING).values_list(
+                'post_id', flat=True
+            ),
+            per_page,
+            **kwargs,
+        )
+
+    def fetch(self, position, limit):
+        return resolve_posts(
+            seek(self.object_list, position, pk='post_id')[:limit]
+        )
+
+    def _get_page(self, object_list, number, paginator):
+        return super()._get_page(
+            resolve_posts(object_list), number, paginator
+        )
+
+
+def resolve_posts(post_ids):
+    """Карточки постов в порядке переданных id."""
+    post_ids = list(post_ids)
+    posts = feed_posts().in_bulk(post_ids)
+    return [posts[pk] for pk in post_ids if pk in posts]
+
+
+def is_pulled(author_id):
+    """Посты авторов с огромным числом подписчиков не раскладываются по
+    лентам, а подмешиваются при чтении."""
+    return (
+        get_count(Counter.FOLLOWERS, author_id)
+        > settings.TIMELINE_PULL_THRESHOLD
+    )
+
+
+def _entries(user_ids, post):
+    return [
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in user_ids
+    ]
+
+
+def _follower_batches(author_id):
+    batch_size = settings.TIMELINE_BATCH_SIZE
+    follower_ids = (
+        Follow.objects.filter(author_id=author_id)
+        .order_by()
+        .values_list('user_id', flat=True)
+        .distinct()
+        .iterator(chunk_size=batch_size)
+    )
+    batch = []
+    for user_id in follower_ids:
+        batch.append(user_id)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    for batch in _follower_batches(post.author_id):
+        TimelineEntry.objects.bulk_create(
+            _entries(batch, post), ignore_conflicts=True,
+        )
+
+
+def recent_posts(author_id):
+    return Post.objects.filter(author_id=author_id).only(
+        'pk', 'author_id', 'pub_date'
+    )[:settings.TIMELINE_BACKFILL_SIZE]
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту читателя последние посты нового автора."""
+    if is_pulled(author_id):
+        return
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.pk,
+                author_id=author_id,
+                pub_date=post.pub_date,
+            )
+            for post in recent_posts(author_id)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def unpull(author_id):
+    """Автор опустился до порога TIMELINE_PULL_THRESHOLD.
+
+    Его посты больше не подмешиваются при чтении, а при публикации их не
+    раскладывали, поэтому последние посты возвращаются в ленты всех
+    оставшихся подписчиков.
+    """
+    if (
+        get_count(Counter.FOLLOWERS, author_id)
+        != settings.TIMELINE_PULL_THRESHOLD
+    ):
+        return
+    recent = list(recent_posts(author_id))
+    for batch in _follower_batches(author_id):
+        TimelineEntry.objects.bulk_create(
+            [entry for post in recent for entry in _entries(batch, post)],
+            ignore_conflicts=True,
+        )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты читателя посты автора, от которого он отписался."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def pulled_authors(author_ids):
+    return set(
+        Counter.objects.filter(
+            kind=Counter.FOLLOWERS,
+            object_id__in=author_ids,
+            value__gt=settings.TIMELINE_PULL_THRESHOLD,
+        ).values_list('object_id', flat=True)
+    )
+
+
+def follow_feed(user, per_page, page_number=None, cursor=None):
+    """Страница ленты подписок и путь, которым она собрана.
+
+    Обычные авторы читаются из материализованной ленты, авторы выше
+    TIMELINE_PULL_THRESHOLD — из их собственных постов, и всё сливается
+    по (pub_date, id). Слитую ленту листают только курсором: номер
+    страницы без общего COUNT не имеет смысла, и page_number для неё
+    игнорируется.
+    """
+    followed = set(followed_ids(user.pk))
+    pulled = pulled_authors(followed)
+    entries = TimelineEntry.objects.filter(user=user)
+    if not pulled:
+        paginator = TimelinePaginator(entries, per_page)
+        if cursor:
+            return paginator.page_for_cursor(cursor), PUSH
+        return numbered_page(paginator, page_number), PUSH
+    streams = [
+        CursorPaginator(feed_posts().filter(author_id=author_id), per_page)
+        for author_id in sorted(pulled)
+    ]
+    source = PULL
+    if followed - pulled:
+        streams.insert(0, TimelinePaginator(
+            entries.exclude(author_id__in=pulled), per_page
+        ))
+        source = HYBRID
+    paginator = MergedCursorPaginator(streams, per_page)
+    return paginator.page_for_cursor(cursor), source
@@ -1,86 +1,127 @@
+from urllib.parse import urlencode
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from .cache import attach_related, feed_cache, get_cached_or_404
+from .counters import author_counts, get_count
+from .feeds import feed_posts
+from .follows import follow, graph_version, is_following, unfollow
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
-
-
-def post_peginator(request, posts_list):
-    paginator = Paginator(posts_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+from .models import Comment, Counter, Group, Post, User
+from .paginator import CommentPaginator, get_feed_page
+from .search import SearchPaginator
+from .stats import author_stats
+from .thumbnails import prefetch_thumbnails, queue_post_thumbnails
+from .timeline import follow_feed
+
+
+def comments_page(post_id, cursor=None):
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only('text', 'created', 'author', 'author__username')
+    return CommentPaginator(
+        comments, settings.COMMENTS_PER_PAGE
+    ).page_for_cursor(cursor)
+
+
+def post_peginator(request, posts_list, count=None):
+    return get_feed_page(
+        posts_list,
+        settings.POSTS_PER_PAGE,
+        page_number=request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+        count=count,
+    )
 
 
 def index(request):
-    posts_list = Post.objects.select_related('author').all()
+    posts_list = feed_posts().cache('index')
     page_obj = post_peginator(request, posts_list)
+    prefetch_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
+        'feed_cache': feed_cache(page_obj, 'index'),
     }
     return render(request, 'posts/index.html', context)
 
 
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts_list = Post.objects.select_related('author').filter(group=group)
-    page_obj = post_peginator(request, posts_list)
+    group = get_cached_or_404(Group, slug=slug)
+    posts_list = feed_posts().filter(group=group).cache('group_posts')
+    page_obj = post_peginator(
+        request,
+        posts_list,
+        count=get_count(Counter.GROUP_POSTS, group.pk),
+    )
+    prefetch_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
         'group': group,
+        'feed_cache': feed_cache(page_obj, 'group', group.pk),
     }
     return render(request, 'posts/group_list.html', context)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts_list = Post.objects.filter(author=author)
-    page_obj = post_peginator(request, posts_list)
+    author = get_cached_or_404(User, username=username)
+    posts_list = feed_posts().filter(author=author)
+    counts = author_counts(author)
+    page_obj = post_peginator(request, posts_list, count=counts['posts'])
+    prefetch_thumbnails(page_obj)
     following = (
         request.user.is_authenticated
-        and Follow.objects.filter(
-            user=request.user,
-            author=author,
-        ).exists()
+        and is_following(request.user.pk, author.pk)
     )
     context = {
         'page_obj': page_obj,
         'author': author,
+        'counts': counts,
         'following': following,
+        'feed_cache': feed_cache(page_obj, 'profile', author.pk),
     }
     return render(request, 'posts/profile.html', context)
 
 
 def post_detail(request, post_id):
-    posts = get_object_or_404(Post, id=post_id)
-    posts_list = Post.objects.select_related('author').filter(
-        author=posts.author
-    )
-    comments = posts.comments.all()
+    posts = get_cached_or_404(Post, pk=post_id)
+    attach_related([posts], 'author', 'group')
+    prefetch_thumbnails([posts])
+    comments = comments_page(posts.pk, request.GET.get('comments'))
     form = CommentForm()
-    page_obj = post_peginator(request, posts_list)
     context = {
         'form': form,
         'posts': posts,
-        'page_obj': page_obj,
         'comments': comments,
+        'stats': author_stats(posts.author),
+        'comments_count': get_count(Counter.POST_COMMENTS, posts.pk),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    post = get_cached_or_404(Post, pk=post_id)
+    context = {
+        'post_id': post.pk,
+        'comments': comments_page(post.pk, request.GET.get('cursor')),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
     )
-    author = get_object_or_404(User, pk=request.user.id)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
-        return redirect('posts:profile', author)
+        queue_post_thumbnails(post)
+        return redirect('posts:profile', request.user)
     context = {
         'form': form,
     }
@@ -89,6 +130,8 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
+    # Правка сохраняет все поля формы, поэтому строка берётся из базы,
+    # а не из объектного кеша, который может отставать.
     post = get_object_or_404(Post, pk=post_id, author=request.user)
     form = PostForm(
         request.POST or None,
@@ -98,6 +141,7 @@ def post_edit(request, post_id):
     if form.is_valid():
         post = form.save(commit=False)
         post.save()
+        queue_post_thumbnails(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'post': post,
@@ -109,7 +153,7 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_cached_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -125,32 +169,61 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts_list = Post.objects.select_related('author').filter(
-        author__following__user=request.user
+    page_obj, feed_source = follow_feed(
+        request.user,
+        settings.POSTS_PER_PAGE,
+        page_number=request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
     )
-    page_obj = post_peginator(request, posts_list)
+    prefetch_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
+        'feed_source': feed_source,
+        'feed_cache': feed_cache(
+            page_obj, 'follow', request.user.pk,
+            graph_version(request.user.pk),
+        ),
     }
-    return render(request, 'posts/follow.html', context)
+    response = render(request, 'posts/follow.html', context)
+    response['X-Feed-Source'] = feed_source
+    return response
+
+
+def follow_state(request, author, following):
+    if request.method != 'POST':
+        return redirect('posts:profile', author)
+    return JsonResponse({
+        'following': following,
+        'followers': get_count(Counter.FOLLOWERS, author.pk),
+    })
 
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(user=request.user, author=author)
-    if request.user != author and not follow.exists():
-        Follow.objects.create(user=request.user, author=author)
-    return redirect('posts:profile', author)
+    author = get_cached_or_404(User, username=username)
+    follow(request.user, author)
+    return follow_state(request, author, request.user != author)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(
-        user=request.user,
-        author=author,
-    )
-    if follow.exists():
-        follow.delete()
-    return redirect('posts:profile', author)
+    author = get_cached_or_404(User, username=username)
+    unfollow(request.user, author)
+    return follow_state(request, author, False)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = SearchPaginator(
+            query,
+            settings.POSTS_PER_PAGE,
+        ).page_for_cursor(request.GET.get('cursor'))
+        prefetch_thumbnails(page_obj)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'paginator_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
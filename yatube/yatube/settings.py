@@ -100,6 +100,17 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кто отдаёт байты файлов из MEDIA_ROOT: None — сам Django,
+# 'x-accel-redirect' — nginx (internal location MEDIA_ACCEL_PREFIX),
+# 'x-sendfile' — Apache mod_xsendfile или lighttpd.
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_SERVE_PREFIXES = ('posts/', 'cache/')
+
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
@@ -107,11 +118,55 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+FEED_CACHE_TIMEOUT = 60 * 60
+AUTHOR_STATS_TIMEOUT = 5 * 60
+OBJECT_CACHE_TIMEOUTS = {
+    'posts.Post': 10 * 60,
+    'posts.Group': 60 * 60,
+    'auth.User': 30 * 60,
+}
+QUERY_CACHE_TIMEOUTS = {
+    'index': 5 * 60,
+    'group_posts': 5 * 60,
+}
+
+TIMELINE_BATCH_SIZE = 1000
+TIMELINE_BACKFILL_SIZE = 200
+TIMELINE_PULL_THRESHOLD = 10000
+FOLLOW_GRAPH_CACHE_SIZE = 10000
+
+THUMBNAIL_BACKEND = 'posts.thumbnails.PostThumbnailBackend'
+THUMBNAIL_KVSTORE = 'posts.thumbnails.ThumbnailStore'
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_LOCK_TIMEOUT = 60
+THUMBNAIL_LOCK_WAIT = 0
+THUMBNAIL_PLACEHOLDER = 'img/placeholder.svg'
+POST_IMAGE_MAX_SIZE = 2560
+POST_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+POST_IMAGE_QUALITY = 85
+POST_IMAGE_WIDTHS = (320, 640, 960, 1920)
+POST_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center'}),
+)
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Кеш должен быть общим для всех процессов: в нём версии лент, объектов
+# и подписок, блокировки миниатюр и счётчики попаданий. LocMemCache живёт
+# внутри процесса и годится только для runserver и тестов.
+MEMCACHED_LOCATION = os.environ.get('YATUBE_MEMCACHED')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}